@@ -0,0 +1,115 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from google.api_core.exceptions import PreconditionFailed
+
+# ------------ Config ------------
+ARTIFACT_CAS_PREFIX = os.getenv("ARTIFACT_CAS_PREFIX", "artifacts/cas")
+ARTIFACT_RUNS_PREFIX = os.getenv("ARTIFACT_RUNS_PREFIX", "artifacts/runs")
+
+# Generated tests and pytest reports compress 5-10x; binary artifacts are left alone.
+TEXT_SUFFIXES = (".py", ".xml", ".json", ".txt", ".md", ".log", ".csv", ".html")
+
+
+def sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ArtifactStore:
+    """Content-addressed artifact storage in GCS.
+
+    Every artifact is stored once under its SHA-256
+    (gs://<bucket>/<cas prefix>/ab/abcdef...), gzip-compressed when it is
+    text. A run only writes a small manifest mapping artifact names to those
+    blobs, so re-running an unchanged test uploads nothing but the manifest.
+    """
+
+    def __init__(self, client_factory, bucket: str):
+        self.client_factory = client_factory
+        self.bucket = bucket
+        self._known = set()  # digests already confirmed in the bucket by this process
+        self._lock = threading.Lock()
+
+    def _bucket(self):
+        return self.client_factory().bucket(self.bucket)
+
+    def blob_path(self, digest: str) -> str:
+        return f"{ARTIFACT_CAS_PREFIX}/{digest[:2]}/{digest}"
+
+    def put_bytes(self, name: str, data: bytes, content_type: str = None) -> dict:
+        """Store data unless identical content is already there; return its manifest entry."""
+        digest = sha256_hex(data)
+        compress = name.lower().endswith(TEXT_SUFFIXES)
+        path = self.blob_path(digest)
+        entry = {
+            "name": name,
+            "sha256": digest,
+            "size": len(data),
+            "gs_uri": f"gs://{self.bucket}/{path}",
+            "content_encoding": "gzip" if compress else None,
+            "uploaded": False,
+        }
+
+        with self._lock:
+            if digest in self._known:
+                return entry
+
+        blob = self._bucket().blob(path)
+        if not blob.exists():
+            if compress:
+                # Decompressive transcoding: GCS serves the original bytes to clients.
+                blob.content_encoding = "gzip"
+                payload = gzip.compress(data, mtime=0)
+            else:
+                payload = data
+            try:
+                # if_generation_match=0 makes the create atomic when two runs race.
+                blob.upload_from_string(
+                    payload,
+                    content_type=content_type or ("text/plain" if compress else "application/octet-stream"),
+                    if_generation_match=0,
+                )
+                entry["uploaded"] = True
+                logging.info(f"Uploaded artifact {name} as {digest[:12]} ({len(payload)} bytes)")
+            except PreconditionFailed:
+                pass
+        else:
+            logging.debug(f"Artifact {name} unchanged ({digest[:12]}), skipping upload")
+
+        with self._lock:
+            self._known.add(digest)
+        return entry
+
+    def publish(self, entry: dict, dest_path: str) -> str:
+        """Expose a stored artifact at a stable path (e.g. for the pytest runner).
+
+        Uses a server-side copy and skips it entirely when dest_path already
+        holds the same content, so nothing is re-sent from this process.
+        """
+        bucket = self._bucket()
+        dest = bucket.get_blob(dest_path)
+        if dest is not None and (dest.metadata or {}).get("sha256") == entry["sha256"]:
+            return f"gs://{self.bucket}/{dest_path}"
+        source = bucket.blob(self.blob_path(entry["sha256"]))
+        copied = bucket.copy_blob(source, bucket, dest_path)
+        copied.metadata = {"sha256": entry["sha256"]}
+        copied.patch()
+        return f"gs://{self.bucket}/{dest_path}"
+
+    def write_manifest(self, run_id: str, entries: list) -> str:
+        """Write the per-run manifest pointing at the shared blobs."""
+        path = f"{ARTIFACT_RUNS_PREFIX}/{run_id}/manifest.json"
+        manifest = {
+            "run_id": run_id,
+            "created_at": datetime.utcnow().isoformat(),
+            "artifacts": [{k: v for k, v in e.items() if k != "uploaded"} for e in entries],
+        }
+        self._bucket().blob(path).upload_from_string(
+            json.dumps(manifest, separators=(",", ":")), content_type="application/json"
+        )
+        return f"gs://{self.bucket}/{path}"
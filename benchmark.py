@@ -0,0 +1,409 @@
+"""Load and latency benchmark for the backend, fully offline.
+
+Starts local stand-ins for the Vertex AI generateContent endpoint, GCS and
+BigQuery, points the Flask app at them, drives /chat,
+/tools/normalize_requirement and /upload-docs at fixed concurrency levels and
+prints p50/p95/p99 latency, RPS and a per-stage model breakdown as JSON.
+
+    python benchmark.py --concurrency 1,4,16 --requests 40 --output bench.json
+    python benchmark.py --gunicorn 2x4 --model-latency-ms 300 --error-rate 0.02
+    python benchmark.py --compare bench_before.json bench_after.json
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import socket
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs, unquote
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+SCENARIOS = ("chat", "normalize", "upload")
+
+
+# ------------ Fake cloud ------------
+def fake_model_text(prompt: str) -> str:
+    """Plausible Gemini answers for each pipeline stage, keyed off the prompt wording."""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:6].upper()
+    if prompt.startswith("Classify"):
+        intent = "requirement" if re.search(r"\b(shall|must)\b", prompt, re.I) else "general"
+        return json.dumps({"intent": intent})
+    if "Normalize the medical-device requirement" in prompt:
+        return "```json\n" + json.dumps({
+            "req_id": f"REQ_{digest}",
+            "description": "Basal delivery rate matches the programmed value.",
+            "hazard": "Over-delivery of insulin",
+            "invariant": "delivered_rate == programmed_rate",
+            "acceptance_criteria": ["Rate within 5% of setpoint", "Alarm on deviation"],
+        }) + "\n```"
+    if "Generate 3 detailed test cases" in prompt:
+        return json.dumps([{
+            "test_case_id": f"TC_{digest}_{i}",
+            "title": f"Basal rate check {i}",
+            "preconditions": ["Pump primed", "Basal profile loaded"],
+            "steps": ["Program rate", "Run for one hour", "Measure delivered volume"],
+            "expected_result": "Delivered volume within tolerance",
+        } for i in range(1, 4)])
+    if "single test case" in prompt:
+        return json.dumps({"compliant": True, "missing_elements": "", "related_iso_refs": "ISO 14971 7.1",
+                           "suggestions": "Add boundary values."})
+    if "auditor" in prompt:
+        return json.dumps([{"test_case_id": f"TC_{digest}_{i}", "compliant": True, "missing_elements": "",
+                            "related_iso_refs": "ISO 62304 5.7", "suggestions": ""} for i in range(1, 4)])
+    return "A general answer from the stand-in model."
+
+
+class FakeCloud:
+    """In-memory stand-in for the Vertex, GCS JSON and BigQuery insertAll APIs."""
+
+    def __init__(self, latency_ms: float, jitter: float, error_rate: float, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.objects = {}
+        self.bq_rows = 0
+        self.lock = threading.Lock()
+
+    def model_delay(self) -> float:
+        """Log-normal model latency with the configured median, in seconds."""
+        if self.latency_ms <= 0:
+            return 0.0
+        with self.lock:
+            return self.random.lognormvariate(math.log(self.latency_ms / 1000.0), self.jitter)
+
+    def model_fails(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def handler(self):
+        cloud = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload=None, raw: bytes = None, headers=None):
+                body = raw if raw is not None else json.dumps(payload or {}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+            def _object_meta(self, bucket, name):
+                obj = cloud.objects[(bucket, name)]
+                return {"bucket": bucket, "name": name, "generation": "1", "size": str(len(obj["data"])),
+                        "metadata": obj.get("metadata") or {}, "contentEncoding": obj.get("encoding")}
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)$", url.path) or \
+                    re.match(r"^/download/storage/v1/b/([^/]+)/o/(.+)$", url.path)
+                if not m:
+                    return self._send(404, {"error": {"code": 404, "message": "not found"}})
+                key = (m.group(1), unquote(m.group(2)))
+                if key not in cloud.objects:
+                    return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+                if parse_qs(url.query).get("alt") == ["media"]:
+                    obj = cloud.objects[key]
+                    headers = {"Content-Encoding": obj["encoding"]} if obj.get("encoding") else None
+                    return self._send(200, raw=obj["data"], headers=headers)
+                return self._send(200, self._object_meta(*key))
+
+            def do_PATCH(self):
+                url = urlparse(self.path)
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)$", url.path)
+                key = (m.group(1), unquote(m.group(2))) if m else None
+                if key not in cloud.objects:
+                    return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+                cloud.objects[key]["metadata"] = (json.loads(self._body() or b"{}")).get("metadata")
+                return self._send(200, self._object_meta(*key))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                body = self._body()
+
+                if url.path.endswith(":generateContent"):
+                    time.sleep(cloud.model_delay())
+                    if cloud.model_fails():
+                        return self._send(500, {"error": {"code": 500, "message": "stand-in failure"}})
+                    prompt = json.loads(body)["contents"][0]["parts"][0]["text"]
+                    text = fake_model_text(prompt)
+                    return self._send(200, {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                        "usageMetadata": {"promptTokenCount": len(prompt) // 4,
+                                          "candidatesTokenCount": len(text) // 4},
+                    })
+
+                if url.path.endswith(":predict"):
+                    vec = [b / 255.0 for b in hashlib.sha256(body).digest()]
+                    return self._send(200, {"predictions": [{"embeddings": {"values": vec}}]})
+
+                if url.path.endswith("/insertAll"):
+                    with cloud.lock:
+                        cloud.bq_rows += len(json.loads(body or b"{}").get("rows", []))
+                    return self._send(200, {"kind": "bigquery#tableDataInsertAllResponse"})
+
+                m = re.match(r"^/upload/storage/v1/b/([^/]+)/o$", url.path)
+                if m:
+                    meta, data = self._parse_upload(url, body)
+                    key = (m.group(1), meta.get("name", ""))
+                    if parse_qs(url.query).get("ifGenerationMatch") == ["0"] and key in cloud.objects:
+                        return self._send(412, {"error": {"code": 412, "message": "Precondition Failed"}})
+                    cloud.objects[key] = {"data": data, "encoding": meta.get("contentEncoding"),
+                                          "metadata": meta.get("metadata")}
+                    return self._send(200, self._object_meta(*key))
+
+                m = re.match(r"^/storage/v1/b/([^/]+)/o/(.+)/(?:copyTo|rewriteTo)/b/([^/]+)/o/(.+)$", url.path)
+                if m:
+                    src = (m.group(1), unquote(m.group(2)))
+                    dst = (m.group(3), unquote(m.group(4)))
+                    if src not in cloud.objects:
+                        return self._send(404, {"error": {"code": 404, "message": "No such object"}})
+                    cloud.objects[dst] = dict(cloud.objects[src])
+                    meta = self._object_meta(*dst)
+                    return self._send(200, {**meta, "done": True, "resource": meta})
+
+                return self._send(404, {"error": {"code": 404, "message": f"unhandled {url.path}"}})
+
+            def _parse_upload(self, url, body: bytes):
+                query = parse_qs(url.query)
+                if "name" in query:
+                    return {"name": query["name"][0]}, body
+                # multipart/related: JSON metadata part, then the media part
+                boundary = self.headers.get("Content-Type", "").split("boundary=")[-1].strip('"')
+                parts = body.split(b"--" + boundary.encode("utf-8"))
+                meta, data = {}, b""
+                for part in parts:
+                    if b"\r\n\r\n" not in part:
+                        continue
+                    head, content = part.split(b"\r\n\r\n", 1)
+                    content = content.rstrip(b"\r\n")
+                    if b"application/json" in head and not meta:
+                        meta = json.loads(content)
+                    else:
+                        data = content
+                return meta, data
+
+        return Handler
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# ------------ App under test ------------
+def backend_env(cloud_url: str, workdir: str, allow_reuse: bool) -> dict:
+    return {
+        "VERTEX_API_BASE": cloud_url,
+        "STORAGE_EMULATOR_HOST": cloud_url,
+        "BIGQUERY_API_ENDPOINT": cloud_url,
+        "ANONYMOUS_CREDENTIALS": "true",
+        "LOG_LEVEL": "WARNING",
+        "LOCAL_STORE_PATH": os.path.join(workdir, "bench.db"),
+        "SIMILARITY_INDEX_PATH": os.path.join(workdir, "bench_index.jsonl"),
+        # Benchmark prompts repeat on purpose; don't let reuse short-circuit them.
+        "SIMILARITY_REUSE": "true" if allow_reuse else "false",
+    }
+
+def start_backend(env: dict, gunicorn: str = None):
+    """Start the app in-process (threaded werkzeug) or as a gunicorn subprocess."""
+    port = free_port()
+    if gunicorn:
+        workers, threads = gunicorn.lower().split("x")
+        proc = subprocess.Popen(
+            ["gunicorn", "-c", "gunicorn.conf.py", "--bind", f"127.0.0.1:{port}", "server:app"],
+            env={**os.environ, **env, "WEB_CONCURRENCY": workers, "GUNICORN_THREADS": threads},
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        stop = proc.terminate
+    else:
+        os.environ.update(env)
+        import logging
+        from werkzeug.serving import make_server
+        import server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        httpd = make_server("127.0.0.1", port, server.app, threaded=True)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        stop = httpd.shutdown
+
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(200):
+        try:
+            if requests.get(f"{base}/healthz", timeout=1).status_code == 200:
+                return base, stop
+        except requests.RequestException:
+            time.sleep(0.05)
+    stop()
+    raise SystemExit("backend did not become healthy")
+
+
+# ------------ Load ------------
+_counter = iter(range(10**9))
+_counter_lock = threading.Lock()
+_session = threading.local()
+
+def _next_id() -> int:
+    with _counter_lock:
+        return next(_counter)
+
+def _http() -> requests.Session:
+    if not hasattr(_session, "s"):
+        _session.s = requests.Session()
+    return _session.s
+
+def one_request(base: str, scenario: str):
+    n = _next_id()
+    requirement = f"The pump shall deliver a basal rate of {0.1 + n % 50 / 10:.1f} units/hour (variant {n})."
+    started = time.perf_counter()
+    if scenario == "chat":
+        resp = _http().post(f"{base}/chat", json={"prompt": requirement}, timeout=300)
+    elif scenario == "normalize":
+        resp = _http().post(f"{base}/tools/normalize_requirement", json={"prompt": requirement}, timeout=300)
+    else:
+        files = {"files": (f"bench_{n}.txt", requirement.encode("utf-8") * 64, "text/plain")}
+        resp = _http().post(f"{base}/upload-docs", files=files, timeout=300)
+    return (time.perf_counter() - started) * 1000, resp.status_code
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+def stage_delta(before: dict, after: dict) -> dict:
+    out = {}
+    for stage, a in after.items():
+        b = before.get(stage, {})
+        calls = a["calls"] - b.get("calls", 0)
+        if calls <= 0:
+            continue
+        out[stage] = {
+            "calls": calls,
+            "avg_latency_ms": round((a["latency_ms"] - b.get("latency_ms", 0)) / calls, 2),
+            "avg_input_tokens": round((a["input_tokens"] - b.get("input_tokens", 0)) / calls, 1),
+            "avg_output_tokens": round((a["output_tokens"] - b.get("output_tokens", 0)) / calls, 1),
+        }
+    return out
+
+def run_level(base: str, scenario: str, concurrency: int, total: int) -> dict:
+    before = requests.get(f"{base}/metrics/stages", timeout=10).json()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: one_request(base, scenario), range(total)))
+    wall = time.perf_counter() - started
+    after = requests.get(f"{base}/metrics/stages", timeout=10).json()
+
+    latencies = sorted(ms for ms, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        # With several gunicorn workers this is whichever worker answered /metrics/stages.
+        "stages": stage_delta(before, after),
+    }
+
+
+# ------------ Compare ------------
+def compare(before_path: str, after_path: str):
+    with open(before_path) as fh:
+        before = {(r["scenario"], r["concurrency"]): r for r in json.load(fh)["results"]}
+    with open(after_path) as fh:
+        after = json.load(fh)["results"]
+    print(f"{'scenario':<10} {'conc':>4} {'p50':>10} {'p95':>10} {'p99':>10} {'rps':>10}")
+    for r in after:
+        b = before.get((r["scenario"], r["concurrency"]))
+        if not b:
+            continue
+
+        def pct(key):
+            return f"{(r[key] - b[key]) / b[key] * 100:+.1f}%" if b[key] else "n/a"
+
+        print(f"{r['scenario']:<10} {r['concurrency']:>4} {pct('p50_ms'):>10} {pct('p95_ms'):>10} "
+              f"{pct('p99_ms'):>10} {pct('rps'):>10}")
+
+
+# ------------ Main ------------
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma list of chat,normalize,upload")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma list of concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario and level")
+    parser.add_argument("--model-latency-ms", type=float, default=150.0, help="median stand-in model latency")
+    parser.add_argument("--model-jitter", type=float, default=0.35, help="log-normal sigma of model latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of model calls answered with 500")
+    parser.add_argument("--gunicorn", help="run under gunicorn as WORKERSxTHREADS, e.g. 2x4")
+    parser.add_argument("--allow-reuse", action="store_true", help="let the similarity index reuse results")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here as well as stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="diff two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    cloud = FakeCloud(args.model_latency_ms, args.model_jitter, args.error_rate, args.seed)
+    cloud_port = free_port()
+    cloud_httpd = ThreadingHTTPServer(("127.0.0.1", cloud_port), cloud.handler())
+    cloud_httpd.daemon_threads = True
+    threading.Thread(target=cloud_httpd.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp(prefix="bench_")
+    base, stop = start_backend(backend_env(f"http://127.0.0.1:{cloud_port}", workdir, args.allow_reuse),
+                               args.gunicorn)
+    try:
+        results = []
+        for scenario in args.scenarios.split(","):
+            for level in (int(c) for c in args.concurrency.split(",")):
+                result = run_level(base, scenario.strip(), level, args.requests)
+                print(f"{scenario:<10} c={level:<3} p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                      f"p99={result['p99_ms']:.1f}ms rps={result['rps']:.1f} errors={result['errors']}",
+                      file=sys.stderr)
+                results.append(result)
+    finally:
+        stop()
+        cloud_httpd.shutdown()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "bq_rows_replicated": cloud.bq_rows,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+import os
+import re
+import csv
+import uuid
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from shared_cache import make_cache
+
+# ------------ Config ------------
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", "4"))
+INGEST_CHUNK_BYTES = 64 * 1024
+# A paragraph longer than this is split rather than buffered whole.
+MAX_PARAGRAPH_CHARS = 8 * 1024
+MAX_STATEMENT_CHARS = 2000
+
+REQ_ID_RE = re.compile(r"\b[A-Z][A-Z0-9]*(?:[_-][A-Z0-9]+)*[_-]\d{2,}\b")
+MODAL_RE = re.compile(r"\b(shall|must|should|is required to|will not|shall not)\b", re.I)
+BULLET_RE = re.compile(r"^\s*(?:[-*+•]|\d+[.)]|[a-z][.)]|#+)\s+")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9])")
+CSV_TEXT_COLUMNS = ("requirement", "requirement_text", "description", "text", "statement")
+MAX_TRACKED_JOBS = 100
+# Job snapshots carry only the latest ids and are written at most this often,
+# so publishing progress stays cheap however many statements a job has.
+MAX_PUBLISHED_REQ_IDS = 100
+PUBLISH_INTERVAL_S = 1.0
+
+
+# ------------ Readers ------------
+def iter_text_lines(path: str):
+    """Lines of a text/Markdown file, read in fixed-size chunks."""
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        pending = ""
+        while True:
+            chunk = fh.read(INGEST_CHUNK_BYTES)
+            if not chunk:
+                break
+            lines = (pending + chunk).split("\n")
+            pending = lines.pop()
+            yield from lines
+            # Without newlines the whole file would pile up in `pending`; hand
+            # it on in paragraph-sized pieces, cut at a space where possible.
+            while len(pending) > MAX_PARAGRAPH_CHARS:
+                cut = pending.rfind(" ", 0, MAX_PARAGRAPH_CHARS) + 1 or MAX_PARAGRAPH_CHARS
+                yield pending[:cut]
+                pending = pending[cut:]
+        if pending:
+            yield pending
+
+def iter_csv_lines(path: str):
+    """One line per CSV row: the requirement-like column if there is one, else all cells."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
+            return
+        lowered = [h.strip().lower() for h in header]
+        text_cols = [i for i, h in enumerate(lowered) if h in CSV_TEXT_COLUMNS]
+        id_cols = [i for i, h in enumerate(lowered) if h in ("req_id", "id", "requirement_id")]
+        if not text_cols:
+            yield " ".join(header)
+        for row in reader:
+            cells = [row[i] for i in text_cols if i < len(row)] if text_cols else row
+            ids = [row[i] for i in id_cols if i < len(row) and row[i]]
+            yield " ".join(ids + cells)
+            yield ""  # each row is its own paragraph
+
+def iter_pdf_lines(path: str):
+    """Lines of a PDF, extracted one page at a time (needs pypdf)."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("PDF ingestion requires the pypdf package")
+    reader = PdfReader(path)
+    for page in reader.pages:
+        yield from (page.extract_text() or "").split("\n")
+        yield ""
+
+def iter_document_lines(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return iter_csv_lines(path)
+    if ext == ".pdf":
+        return iter_pdf_lines(path)
+    return iter_text_lines(path)
+
+
+# ------------ Statement detection ------------
+def _paragraphs(lines):
+    """Group lines into paragraphs; blank lines and bullets start a new one."""
+    buf = []
+    size = 0
+    for line in lines:
+        stripped = line.strip()
+        if not stripped or BULLET_RE.match(line):
+            if buf:
+                yield " ".join(buf)
+                buf, size = [], 0
+            if not stripped:
+                continue
+            stripped = BULLET_RE.sub("", line).strip()
+        buf.append(stripped)
+        size += len(stripped)
+        if size >= MAX_PARAGRAPH_CHARS:
+            yield " ".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield " ".join(buf)
+
+def is_requirement(sentence: str) -> bool:
+    return bool(MODAL_RE.search(sentence)) and len(sentence.split()) >= 4
+
+def iter_requirements(lines):
+    """Requirement statements in a stream of document lines.
+
+    A statement is a sentence using normative language (shall/must/should...).
+    A paragraph that starts with a requirement id (e.g. PUMP_BASAL_RATE_001)
+    is kept whole so the id stays with its text.
+    """
+    for paragraph in _paragraphs(lines):
+        if REQ_ID_RE.match(paragraph) and MODAL_RE.search(paragraph):
+            yield paragraph[:MAX_STATEMENT_CHARS]
+            continue
+        for sentence in SENTENCE_SPLIT_RE.split(paragraph):
+            sentence = sentence.strip()
+            if is_requirement(sentence):
+                yield sentence[:MAX_STATEMENT_CHARS]
+
+def statement_key(statement: str) -> bytes:
+    """Dedup key: case, punctuation and whitespace differences don't count."""
+    # Keep decimal points ("0.5 units/hour") but not sentence punctuation.
+    normalized = " ".join(re.sub(r"[^\w\s.]|\.(?!\d)", " ", statement.lower()).split())
+    return hashlib.sha1(normalized.encode("utf-8")).digest()
+
+
+# ------------ Jobs ------------
+class IngestJob:
+    """Progress of one ingestion run; safe to read while it is running."""
+
+    def __init__(self, paths: list, workdir: str = None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.paths = list(paths)
+        self.workdir = workdir  # temporary copies of the documents, removed when the job ends
+        self.status = "queued"
+        self.started_at = None
+        self.finished_at = None
+        self.current_file = None
+        self.statements = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.failed = 0
+        self.req_ids = []
+        self.errors = []
+        self.published_at = 0.0
+        self._lock = threading.Lock()
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "job_id": self.job_id,
+                "status": self.status,
+                "files": [os.path.basename(p) for p in self.paths],
+                "current_file": self.current_file,
+                "statements": self.statements,
+                "duplicates": self.duplicates,
+                "processed": self.processed,
+                "failed": self.failed,
+                "in_flight": self.statements - self.duplicates - self.processed - self.failed,
+                "req_id_count": len(self.req_ids),
+                "req_ids": self.req_ids[-MAX_PUBLISHED_REQ_IDS:],
+                "errors": self.errors[-20:],
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+def run_ingest(job: IngestJob, process, max_workers: int = INGEST_MAX_CONCURRENCY):
+    """Stream every document of the job through `process(statement) -> result`.
+
+    At most `max_workers` statements are processed at once and at most
+    2 * max_workers are waiting, so memory stays flat however long the
+    documents are: the readers only advance as fast as the pipeline drains.
+    """
+    seen = set()
+    slots = threading.BoundedSemaphore(max_workers * 2)
+
+    def handle(statement):
+        try:
+            result = process(statement) or {}
+            requirement = result.get("requirement") if isinstance(result, dict) else None
+            with job._lock:
+                job.processed += 1
+                if isinstance(requirement, dict) and requirement.get("req_id"):
+                    job.req_ids.append(requirement["req_id"])
+        except Exception as e:
+            logging.error(f"Ingest {job.job_id}: failed to process statement: {e}")
+            with job._lock:
+                job.failed += 1
+                job.errors.append(f"{statement[:80]}: {e}")
+        finally:
+            slots.release()
+            publish(job, force=False)
+
+    job.status = "running"
+    job.started_at = time.time()
+    publish(job)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for path in job.paths:
+                job.current_file = os.path.basename(path)
+                try:
+                    for statement in iter_requirements(iter_document_lines(path)):
+                        key = statement_key(statement)
+                        with job._lock:
+                            job.statements += 1
+                            if key in seen:
+                                job.duplicates += 1
+                                continue
+                            seen.add(key)
+                        slots.acquire()
+                        pool.submit(handle, statement)
+                except Exception as e:
+                    logging.error(f"Ingest {job.job_id}: cannot read {path}: {e}")
+                    with job._lock:
+                        job.errors.append(f"{os.path.basename(path)}: {e}")
+    finally:
+        if job.workdir:
+            shutil.rmtree(job.workdir, ignore_errors=True)
+    job.current_file = None
+    job.status = "completed" if not job.errors else "completed_with_errors"
+    job.finished_at = time.time()
+    publish(job)
+    logging.info(f"Ingest {job.job_id} finished: {job.to_dict()}")
+
+
+# Progress is published to the job cache so any gunicorn worker can answer a
+# status request when CACHE_BACKEND=shared.
+_job_cache = make_cache("ingest_jobs", MAX_TRACKED_JOBS)
+
+def publish(job: IngestJob, force: bool = True):
+    """Write the job's snapshot; unforced updates are dropped within PUBLISH_INTERVAL_S of the last."""
+    now = time.monotonic()
+    with job._lock:
+        if not force and now - job.published_at < PUBLISH_INTERVAL_S:
+            return
+        job.published_at = now
+    _job_cache.set(job.job_id, job.to_dict())
+
+def start_ingest(paths: list, process, max_workers: int = INGEST_MAX_CONCURRENCY, workdir: str = None) -> IngestJob:
+    """Run an ingestion job in a background thread and return it immediately.
+
+    `workdir`, if given, holds the job's copies of the documents and is
+    deleted once the job has read them.
+    """
+    job = IngestJob(paths, workdir)
+    publish(job)
+    threading.Thread(target=run_ingest, args=(job, process, max_workers), name=f"ingest-{job.job_id}",
+                     daemon=True).start()
+    return job
+
+def job_status(job_id: str):
+    return _job_cache.get(job_id)
@@ -0,0 +1,116 @@
+import json
+import gzip
+import zlib
+import logging
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is offered instead
+    brotli = None
+
+# Bodies smaller than this go out uncompressed; the headers would eat the gain.
+MIN_COMPRESS_BYTES = 1024
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+def dumps_bytes(obj) -> bytes:
+    """Compact JSON straight to bytes, with orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            logging.debug("orjson could not encode response, using json")
+    return json.dumps(obj, separators=(",", ":"), default=str).encode("utf-8")
+
+def choose_encoding(accept_encoding: str) -> str:
+    """Pick br, gzip or identity from an Accept-Encoding header (q-values respected)."""
+    offered = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            offered[name.lower()] = q
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return "identity"
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=5)
+    return body
+
+def json_response(obj, request, status: int = 200) -> Response:
+    """Compact JSON response, compressed as the client allows."""
+    body = dumps_bytes(obj)
+    encoding = choose_encoding(request.headers.get("Accept-Encoding", ""))
+    resp = Response(status=status, mimetype="application/json")
+    if encoding != "identity" and len(body) >= MIN_COMPRESS_BYTES:
+        body = _compress(body, encoding)
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept-Encoding"
+    resp.set_data(body)
+    return resp
+
+def wants_ndjson(request) -> bool:
+    return (
+        request.args.get("stream") == "ndjson"
+        or NDJSON_MIMETYPE in request.headers.get("Accept", "")
+    )
+
+def ndjson_records(obj):
+    """One JSON line per top-level field; list fields yield one line per item.
+
+    {"requirement": {...}, "test_cases": [a, b]} becomes
+    {"requirement": {...}} / {"test_cases": a} / {"test_cases": b}, so large
+    test-case and verdict lists are never encoded as a single document.
+    """
+    if not isinstance(obj, dict):
+        yield dumps_bytes(obj) + b"\n"
+        return
+    for key, value in obj.items():
+        if isinstance(value, list):
+            for item in value:
+                yield dumps_bytes({key: item}) + b"\n"
+        else:
+            yield dumps_bytes({key: value}) + b"\n"
+
+def ndjson_response(obj, request, status: int = 200) -> Response:
+    """Stream obj as NDJSON, gzip-compressed incrementally if accepted."""
+    encoding = "gzip" if choose_encoding(request.headers.get("Accept-Encoding", "")) != "identity" else "identity"
+
+    def generate():
+        if encoding == "identity":
+            yield from ndjson_records(obj)
+            return
+        compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for line in ndjson_records(obj):
+            # Sync-flush so each record reaches the client as soon as it is encoded.
+            yield compressor.compress(line) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    resp = Response(generate(), status=status, mimetype=NDJSON_MIMETYPE)
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.headers["Vary"] = "Accept, Accept-Encoding"
+    return resp
+
+def respond(obj, request, status: int = 200) -> Response:
+    """NDJSON stream when the client asked for it, compact JSON otherwise."""
+    if wants_ndjson(request):
+        return ndjson_response(obj, request, status)
+    return json_response(obj, request, status)
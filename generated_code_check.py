@@ -0,0 +1,246 @@
+"""Fast static checks for LLM-generated pytest files.
+
+Runs in milliseconds, before anything is uploaded or executed remotely:
+extracts the code from Markdown fences, parses it with `ast`, rejects
+network/process/filesystem access (following import aliases), rejects
+imports of modules that are not installed and confirms pytest would collect
+at least one test (judged from the syntax tree). The generated code is never
+imported or executed here; the checks are a quality gate, not a sandbox.
+
+    python generated_code_check.py generated.py --write   # clean in place, exit 1 if invalid
+"""
+import re
+import ast
+import sys
+import json
+import argparse
+import importlib.util
+
+FENCE_RE = re.compile(r"```[ \t]*([\w+-]*)[^\n]*\n(.*?)```", re.S)
+
+FORBIDDEN_MODULES = {
+    "socket", "ssl", "subprocess", "multiprocessing", "ctypes", "shutil", "signal",
+    "requests", "urllib", "urllib3", "http", "httpx", "aiohttp", "ftplib", "smtplib",
+    "telnetlib", "paramiko", "google", "boto3",
+}
+
+FORBIDDEN_CALLS = {"open", "eval", "exec", "compile", "__import__", "input", "breakpoint"}
+
+FORBIDDEN_ATTR_CALLS = {
+    ("os", "system"), ("os", "popen"), ("os", "remove"), ("os", "unlink"), ("os", "rmdir"),
+    ("os", "removedirs"), ("os", "rename"), ("os", "replace"), ("os", "makedirs"), ("os", "mkdir"),
+    ("os", "kill"), ("os", "fork"), ("os", "execv"), ("os", "execvp"), ("os", "spawnv"),
+    ("os", "open"), ("io", "open"), ("codecs", "open"), ("builtins", "open"), ("builtins", "eval"),
+    ("builtins", "exec"), ("builtins", "compile"), ("builtins", "__import__"),
+}
+
+# Calls that import a module by name; the name must be a literal, allowed module.
+DYNAMIC_IMPORT_CALLS = {("importlib", "import_module"), ("importlib", "__import__")}
+
+# Modules whose attributes may not be looked up by a computed name
+# (getattr(os, "sys" + "tem") would otherwise slip past FORBIDDEN_ATTR_CALLS).
+RESTRICTED_GETATTR_MODULES = {"os", "io", "sys", "builtins", "importlib", "codecs", "posix", "pathlib"}
+
+# Methods that write or delete regardless of the receiver (pathlib and friends).
+FORBIDDEN_METHODS = {"write_text", "write_bytes", "unlink", "rmdir", "rmtree", "touch", "mkdir"}
+
+# pytest's temporary-directory fixtures: writing below these is allowed.
+TMP_FIXTURES = {"tmp_path", "tmpdir", "tmp_path_factory", "tmpdir_factory"}
+
+
+def extract_code(text: str) -> str:
+    """Return the Python in an LLM answer: the largest fenced block, else the text."""
+    blocks = [
+        body for lang, body in FENCE_RE.findall(text or "")
+        if lang.lower() in ("", "python", "py", "python3")
+    ]
+    if blocks:
+        return max(blocks, key=len).strip() + "\n"
+    # An unterminated fence: drop the opening line and any stray fence lines.
+    lines = [line for line in (text or "").splitlines() if not line.lstrip().startswith("```")]
+    return "\n".join(lines).strip() + "\n"
+
+def _root(name: str) -> str:
+    return name.split(".", 1)[0]
+
+def _split(qualified: str):
+    module, _, attr = qualified.rpartition(".")
+    return module, attr
+
+def _import_aliases(tree: ast.AST) -> dict:
+    """{local name: qualified name} bound by import statements ("o" -> "os", "system" -> "os.system")."""
+    aliases = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    aliases[alias.asname] = alias.name
+                else:
+                    aliases[_root(alias.name)] = _root(alias.name)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            for alias in node.names:
+                aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+    return aliases
+
+def _qualified(node: ast.AST, aliases: dict):
+    """Dotted name of a Name/Attribute chain with import aliases resolved, else None."""
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    return ".".join([aliases.get(node.id, node.id)] + attrs[::-1])
+
+def _base_name(node: ast.AST):
+    """The variable an expression like (tmp_path / "a").joinpath("b") starts from."""
+    while True:
+        if isinstance(node, ast.Attribute):
+            node = node.value
+        elif isinstance(node, ast.Call):
+            node = node.func
+        elif isinstance(node, ast.BinOp):
+            node = node.left
+        elif isinstance(node, ast.Subscript):
+            node = node.value
+        else:
+            return node.id if isinstance(node, ast.Name) else None
+
+def _in_tmp_dir(node: ast.AST) -> bool:
+    return node is not None and _base_name(node) in TMP_FIXTURES
+
+def _open_mode(call: ast.Call, position: int):
+    """The literal mode argument of an open() call, "r" when omitted, None when not a literal."""
+    mode = next((k.value for k in call.keywords if k.arg == "mode"), None)
+    if mode is None:
+        mode = call.args[position] if len(call.args) > position else ast.Constant("r")
+    return mode.value if isinstance(mode, ast.Constant) and isinstance(mode.value, str) else None
+
+def _forbidden_usage(tree: ast.AST) -> list:
+    errors = []
+    aliases = _import_aliases(tree)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if _root(alias.name) in FORBIDDEN_MODULES:
+                    errors.append(f"line {node.lineno}: forbidden import {alias.name}")
+        elif isinstance(node, ast.ImportFrom):
+            if node.module and _root(node.module) in FORBIDDEN_MODULES:
+                errors.append(f"line {node.lineno}: forbidden import from {node.module}")
+            elif node.module:
+                for alias in node.names:
+                    if (node.module, alias.name) in FORBIDDEN_ATTR_CALLS | DYNAMIC_IMPORT_CALLS:
+                        errors.append(f"line {node.lineno}: forbidden import {node.module}.{alias.name}")
+        elif isinstance(node, ast.Call):
+            func = node.func
+            first_arg = node.args[0] if node.args else None
+            qualified = _qualified(func, aliases)
+            if isinstance(func, ast.Name) and func.id == "getattr" and len(node.args) >= 2:
+                target = _qualified(node.args[0], aliases) or ""
+                name = node.args[1].value if isinstance(node.args[1], ast.Constant) else None
+                if target in ("__builtins__",) or (
+                    _root(target) in RESTRICTED_GETATTR_MODULES
+                    and (not isinstance(name, str) or (target, name) in FORBIDDEN_ATTR_CALLS | DYNAMIC_IMPORT_CALLS)
+                ):
+                    errors.append(f"line {node.lineno}: forbidden getattr({ast.unparse(node.args[0])}, ...)")
+            if isinstance(func, ast.Name) and func.id in FORBIDDEN_CALLS and func.id not in aliases:
+                if func.id == "open" and _in_tmp_dir(first_arg):
+                    continue
+                errors.append(f"line {node.lineno}: forbidden call {func.id}()")
+            elif qualified and _split(qualified) in FORBIDDEN_ATTR_CALLS:
+                if _split(qualified)[1] in ("open", "mkdir", "makedirs", "remove", "unlink") and _in_tmp_dir(first_arg):
+                    continue
+                errors.append(f"line {node.lineno}: forbidden call {qualified}()")
+            elif qualified and _split(qualified) in DYNAMIC_IMPORT_CALLS:
+                target = first_arg.value if isinstance(first_arg, ast.Constant) else None
+                if not isinstance(target, str) or _root(target) in FORBIDDEN_MODULES:
+                    errors.append(f"line {node.lineno}: forbidden dynamic import {qualified}({ast.unparse(first_arg) if first_arg else ''})")
+            elif isinstance(func, ast.Attribute) and not _in_tmp_dir(func.value):
+                if func.attr in FORBIDDEN_METHODS:
+                    errors.append(f"line {node.lineno}: forbidden file-system call .{func.attr}()")
+                elif func.attr == "open":
+                    mode = _open_mode(node, 0)
+                    if mode is None or set(mode) & set("wax+"):
+                        errors.append(f"line {node.lineno}: forbidden file-system call .open({mode!r})")
+    return errors
+
+def collected_tests(tree: ast.Module) -> list:
+    """Test ids pytest's default rules would collect from this module."""
+    tests = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            tests.append(node.name)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            methods = [n for n in node.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            if any(m.name == "__init__" for m in methods):
+                continue  # pytest refuses to collect classes with __init__
+            tests.extend(f"{node.name}::{m.name}" for m in methods if m.name.startswith("test"))
+    return tests
+
+def _missing_imports(tree: ast.AST) -> list:
+    """Absolute imports whose top-level module is not installed, found without importing anything."""
+    errors, seen = [], set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            root = _root(name)
+            if root in seen or root in sys.stdlib_module_names:
+                continue
+            seen.add(root)
+            try:
+                found = importlib.util.find_spec(root) is not None
+            except (ImportError, ValueError):
+                found = False
+            if not found:
+                errors.append(f"line {node.lineno}: module {root} is not installed")
+    return errors
+
+def check_test_code(text: str, check_imports: bool = True) -> dict:
+    """Validate generated test code.
+
+    Returns {"ok", "code", "errors", "tests"} where "code" is the extracted
+    Python that should be written/uploaded instead of the raw answer. With
+    `check_imports`, imports of modules not installed here are errors.
+    """
+    code = extract_code(text)
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return {"ok": False, "code": code, "errors": [f"line {e.lineno}: syntax error: {e.msg}"], "tests": []}
+
+    errors = _forbidden_usage(tree)
+    tests = collected_tests(tree)
+    if not tests:
+        errors.append("no tests would be collected (expected test_* functions or Test* classes)")
+    if check_imports:
+        errors.extend(_missing_imports(tree))
+    return {"ok": not errors, "code": code, "errors": errors, "tests": tests}
+
+def feedback_prompt(result: dict) -> str:
+    """Instruction appended to the generation prompt after a rejected attempt."""
+    return (
+        "\nYour previous answer was rejected by static validation:\n"
+        + "\n".join(f"- {e}" for e in result["errors"])
+        + "\nReturn ONLY a valid, self-contained Python pytest file without Markdown fences or explanations.\n"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="generated test file (may contain Markdown)")
+    parser.add_argument("--write", action="store_true", help="replace the file with the extracted code")
+    parser.add_argument("--no-import-check", action="store_true", help="allow modules not installed here")
+    args = parser.parse_args()
+
+    with open(args.path, encoding="utf-8") as fh:
+        result = check_test_code(fh.read(), check_imports=not args.no_import_check)
+    if args.write and result["ok"]:
+        with open(args.path, "w", encoding="utf-8") as fh:
+            fh.write(result["code"])
+    print(json.dumps({k: v for k, v in result.items() if k != "code"}))
+    sys.exit(0 if result["ok"] else 1)
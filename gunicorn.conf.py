@@ -0,0 +1,36 @@
+# Gunicorn settings for the backend:  gunicorn -c gunicorn.conf.py server:app
+#
+# Workers/threads come from the measured request profile: set REQUEST_CPU_MS
+# and REQUEST_IO_MS from GET /metrics/process under representative load
+# (benchmark.py works), or pin them with WEB_CONCURRENCY / GUNICORN_THREADS.
+# Workers default to the CPUs the container may use (affinity mask and cgroup
+# quota), not the host core count.
+import os
+import logging
+
+from process_model import recommended_pool
+
+_pool = recommended_pool(
+    cpu_ms=float(os.getenv("REQUEST_CPU_MS", "25")),
+    io_ms=float(os.getenv("REQUEST_IO_MS", "2500")),
+    max_threads=int(os.getenv("GUNICORN_MAX_THREADS", "32")),
+)
+
+bind = f":{os.getenv('PORT', '8080')}"
+workers = int(os.getenv("WEB_CONCURRENCY", _pool["workers"]))
+threads = int(os.getenv("GUNICORN_THREADS", _pool["threads"]))
+worker_class = "gthread"
+timeout = 0
+
+# Import the app once in the master so indexes, config and templates are built
+# before forking and shared copy-on-write. Everything process-bound (HTTP
+# sessions, SQLite connections, background threads) is created lazily per
+# worker, which is what makes this safe.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    logging.getLogger("gunicorn.error").info(
+        f"Serving with {workers} workers x {threads} threads (preload={preload_app}, "
+        f"cache backend={os.getenv('CACHE_BACKEND', 'local')})"
+    )
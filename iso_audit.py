@@ -0,0 +1,148 @@
+import os
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from prompt_budget import budget_for, compact_json, estimate_tokens, fit_json
+from prompt_registry import prompt_templates
+from shared_cache import make_cache
+
+# ------------ Config ------------
+ISO_VALIDATION_MODE = os.getenv("ISO_VALIDATION_MODE", "batch")  # batch | per_case
+# Per-case audits in flight per worker process, across all requests and ingest jobs.
+ISO_MAX_CONCURRENCY = int(os.getenv("ISO_MAX_CONCURRENCY", "4"))
+ISO_CACHE_SIZE = int(os.getenv("ISO_CACHE_SIZE", "1024"))
+
+VERDICT_FIELDS = ("req_id", "test_case_id", "compliant", "missing_elements", "related_iso_refs", "suggestions")
+
+# ------------ Prompts ------------
+def build_batch_prompt(requirement, test_cases) -> str:
+    """One audit prompt covering every test case (iso_validation template)."""
+    template = prompt_templates.choose("iso_validation", key=compact_json(requirement))
+    # The requirement gets at most a quarter of the budget; test cases get the rest.
+    budget = budget_for("iso_validation") - template.static_tokens
+    requirement_json = fit_json(requirement, budget // 4)
+    test_cases_json = fit_json(test_cases, budget - estimate_tokens(requirement_json))
+    return template.render(requirement=requirement_json, test_cases=test_cases_json)
+
+def build_case_prompt(requirement, test_case) -> str:
+    """Small, bounded audit prompt for one test case (iso_case template)."""
+    template = prompt_templates.choose("iso_case", key=compact_json(requirement))
+    budget = budget_for("iso_case") - template.static_tokens
+    requirement_json = fit_json(requirement, budget // 3)
+    test_case_json = fit_json(test_case, budget - estimate_tokens(requirement_json))
+    return template.render(requirement=requirement_json, test_case=test_case_json)
+
+# ------------ Verdicts ------------
+def as_case_list(test_cases) -> list:
+    """Test cases come back as a list, {"test_cases": [...]} or a single dict."""
+    if isinstance(test_cases, list):
+        return test_cases
+    if isinstance(test_cases, dict):
+        for value in test_cases.values():
+            if isinstance(value, list):
+                return value
+        return [test_cases] if test_cases else []
+    return []
+
+def to_verdict_list(iso_validation, requirement) -> list:
+    """Flatten a dict or list audit answer into uniform verdict rows."""
+    requirement = requirement if isinstance(requirement, dict) else {}
+    if isinstance(iso_validation, dict):
+        # e.g. {"validations": [...]} vs. a single verdict object
+        nested = [
+            v for v in iso_validation.values()
+            if isinstance(v, list) and v and all(isinstance(x, dict) for x in v)
+        ]
+        entries = nested[0] if nested else [iso_validation]
+    elif isinstance(iso_validation, list):
+        entries = iso_validation
+    else:
+        entries = []
+
+    verdicts = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry:
+            continue
+        verdict = {field: entry.get(field) for field in VERDICT_FIELDS}
+        verdict["req_id"] = verdict["req_id"] or requirement.get("req_id")
+        verdicts.append(verdict)
+    return verdicts
+
+# ------------ Per-case cache ------------
+# Shared across gunicorn workers when CACHE_BACKEND=shared.
+_case_cache = make_cache("iso_case", ISO_CACHE_SIZE)
+
+def case_cache_key(requirement, test_case) -> str:
+    payload = compact_json({"requirement": requirement, "test_case": test_case})
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ------------ Per-case validation ------------
+_pool_state = {"pid": None, "pool": None}
+_pool_lock = threading.Lock()
+
+def _audit_pool() -> ThreadPoolExecutor:
+    """The worker's one audit pool, so ISO_MAX_CONCURRENCY bounds the process, not each request.
+
+    Created lazily and again after a fork, like the other process-bound clients.
+    """
+    with _pool_lock:
+        if _pool_state["pid"] != os.getpid():
+            _pool_state.update({
+                "pid": os.getpid(),
+                "pool": ThreadPoolExecutor(max_workers=max(1, ISO_MAX_CONCURRENCY), thread_name_prefix="iso-audit"),
+            })
+        return _pool_state["pool"]
+
+def validate_per_case(requirement, test_cases, audit) -> list:
+    """Audit each test case as its own request and merge into one verdict list.
+
+    `audit` takes a prompt and returns the parsed JSON answer. Cases are
+    audited concurrently on the worker's shared pool (at most
+    ISO_MAX_CONCURRENCY in flight per process, however many requests are
+    auditing), results keep the order of the input cases, and a failing case
+    yields an error verdict instead of spoiling the others.
+    """
+    cases = as_case_list(test_cases)
+    requirement = requirement if isinstance(requirement, dict) else {}
+
+    def audit_case(test_case):
+        key = case_cache_key(requirement, test_case)
+        cached = _case_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+        case_id = test_case.get("test_case_id") if isinstance(test_case, dict) else None
+        try:
+            verdicts = to_verdict_list(audit(build_case_prompt(requirement, test_case)), requirement)
+        except Exception as e:
+            logging.error(f"ISO audit failed for test case {case_id}: {e}")
+            verdicts = []
+
+        if not verdicts:
+            return {
+                "req_id": requirement.get("req_id"),
+                "test_case_id": case_id,
+                "compliant": None,
+                "missing_elements": None,
+                "related_iso_refs": None,
+                "suggestions": None,
+                "error": "unparsable audit response",
+            }
+
+        verdict = verdicts[0]
+        verdict["test_case_id"] = verdict["test_case_id"] or case_id
+        _case_cache.set(key, verdict)
+        return dict(verdict)
+
+    if not cases:
+        return []
+
+    verdicts = list(_audit_pool().map(audit_case, cases))
+
+    validated_at = datetime.utcnow().isoformat()
+    for verdict in verdicts:
+        verdict.setdefault("validated_at", validated_at)
+    return verdicts
@@ -0,0 +1,184 @@
+"""Per-test-case results from pytest's JUnit XML, streamed in constant memory.
+
+Each <testcase> is turned into a runs row (status, duration, requirement id)
+as soon as its end tag is parsed and then dropped from the tree, so a report
+with hundreds of thousands of cases ingests without holding it in memory.
+Rows are written to the local store in batches.
+
+    python junit_results.py junit.xml --run-id 20250912_211520 --source PUMP_BASAL_RATE_001_test.py
+"""
+import re
+import ast
+import sys
+import json
+import math
+import time
+import argparse
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+# Requirement ids like PUMP_BASAL_RATE_001 or REQ-12, also when embedded in a
+# test or file name (test_rate_PUMP_BASAL_RATE_001, PUMP_BASAL_RATE_001_test.py).
+REQ_ID_RE = re.compile(r"(?<![A-Za-z0-9])[A-Z][A-Z0-9]*(?:[_-][A-Z0-9]+)*[_-]\d{2,}(?![0-9])")
+INGEST_BATCH_SIZE = 1000
+MESSAGE_CHARS = 500
+
+
+# ------------ Requirement ids ------------
+def req_id_from_name(name: str):
+    match = REQ_ID_RE.search(name or "")
+    return match.group(0) if match else None
+
+def req_ids_from_source(code: str) -> dict:
+    """{test function name: req_id} from docstrings; "" holds the module docstring's id."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return {}
+    ids = {}
+    module_id = req_id_from_name(ast.get_docstring(tree) or "")
+    if module_id:
+        ids[""] = module_id
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            found = req_id_from_name(ast.get_docstring(node) or "")
+            if found:
+                ids[node.name] = found
+    return ids
+
+def case_req_id(case: dict, req_ids: dict = None, default: str = None):
+    """Docstring of the test (or its class), then the test name, module docstring, file name, default."""
+    req_ids = req_ids or {}
+    name = case["name"].split("[", 1)[0]
+    cls = case["nodeid"].split("::")[-2] if case["nodeid"].count("::") > 1 else None
+    return (
+        req_ids.get(name)
+        or (req_ids.get(cls) if cls else None)
+        or req_id_from_name(name)
+        or req_ids.get("")
+        or req_id_from_name(case["file"])
+        or default
+    )
+
+
+# ------------ Parsing ------------
+def _nodeid(classname: str, name: str, file: str = None):
+    """pytest node id from a JUnit classname ("pkg.mod.TestClass") and test name."""
+    if not classname and not file:
+        # Collection errors are reported with the module as the name.
+        file = name.replace(".", "/") + ".py"
+        return file, file
+    parts = [p for p in (classname or "").split(".") if p]
+    split = next((i for i, p in enumerate(parts) if p.startswith("Test")), len(parts))
+    module, classes = parts[:split], parts[split:]
+    if not file:
+        file = "/".join(module) + ".py" if module else ""
+    return file, "::".join([file] + classes + [name])
+
+def iter_cases(source):
+    """Yield one dict per <testcase> of a JUnit XML file (path or binary file object).
+
+    Status is passed, failed, error or skipped; duration_ms comes from the
+    case's time attribute.
+    """
+    stack = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != "testcase":
+            continue
+        status, message = "passed", None
+        for child in elem:
+            if child.tag in ("failure", "error", "skipped"):
+                status = {"failure": "failed"}.get(child.tag, child.tag)
+                message = (child.get("message") or child.text or "")[:MESSAGE_CHARS]
+                break
+        file, nodeid = _nodeid(elem.get("classname"), elem.get("name", ""), elem.get("file"))
+        try:
+            seconds = float(elem.get("time") or 0)
+        except ValueError:
+            seconds = None
+        # "inf"/"nan" parse as floats but have no millisecond value.
+        duration_ms = int(round(seconds * 1000)) if seconds is not None and math.isfinite(seconds) else None
+        yield {
+            "nodeid": nodeid,
+            "file": file,
+            "name": elem.get("name", ""),
+            "status": status,
+            "duration_ms": duration_ms,
+            "message": message,
+        }
+        # Detach parsed cases so memory stays flat however large the report is.
+        if stack:
+            stack[-1].remove(elem)
+
+
+# ------------ Ingestion ------------
+def ingest_junit(source, store, run_id: str, req_ids: dict = None, default_req_id: str = None,
+                 replicate=None, fields: dict = None, batch_size: int = INGEST_BATCH_SIZE) -> dict:
+    """Stream a JUnit report into the runs table, one row per test case.
+
+    All-or-nothing: the batches are written in one transaction, so a report
+    that turns out to be malformed halfway (ET.ParseError) leaves nothing
+    behind. `replicate(rows)` (e.g. a BigQuery replica enqueue) gets the
+    run's rows in batches only after they are committed; `fields` adds
+    hazard/invariant to every row. Returns totals, summed duration and
+    per-file durations.
+    """
+    started = time.perf_counter()
+    ts = datetime.utcnow().isoformat()
+    totals, file_ms, batch = {}, {}, []
+    cases = duration_ms = 0
+
+    with store.transaction():
+        for case in iter_cases(source):
+            cases += 1
+            totals[case["status"]] = totals.get(case["status"], 0) + 1
+            duration_ms += case["duration_ms"] or 0
+            file_ms[case["file"]] = file_ms.get(case["file"], 0) + (case["duration_ms"] or 0)
+            batch.append({
+                **(fields or {}),
+                "run_id": run_id,
+                "test_name": case["nodeid"],
+                "req_id": case_req_id(case, req_ids, default_req_id),
+                "status": case["status"],
+                "duration_ms": case["duration_ms"],
+                "ts": ts,
+            })
+            if len(batch) >= batch_size:
+                store.upsert_runs(batch)
+                batch.clear()
+        if batch:
+            store.upsert_runs(batch)
+    if replicate is not None:
+        for rows in store.iter_run_rows(run_id, batch_size):
+            replicate(rows)
+    return {
+        "run_id": run_id,
+        "cases": cases,
+        "totals": totals,
+        "duration_ms": duration_ms,
+        "file_duration_ms": file_ms,
+        "ingest_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+if __name__ == "__main__":
+    from local_store import LocalStore
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="JUnit XML written by pytest --junitxml")
+    parser.add_argument("--run-id", required=True)
+    parser.add_argument("--req-id", help="requirement id for cases that name none")
+    parser.add_argument("--source", action="append", default=[], help="test file whose docstrings name requirement ids")
+    args = parser.parse_args()
+
+    req_ids = {}
+    for path in args.source:
+        with open(path, "r", encoding="utf-8", errors="replace") as fh:
+            req_ids.update(req_ids_from_source(fh.read()))
+    summary = ingest_junit(args.path, LocalStore(), args.run_id, req_ids, args.req_id)
+    print(json.dumps(summary))
+    sys.exit(0 if summary["cases"] else 1)
@@ -0,0 +1,406 @@
+import os
+import json
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+# ------------ Config ------------
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", "/tmp/healthcare.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requirements (
+    req_id TEXT PRIMARY KEY,
+    prompt TEXT,
+    description TEXT,
+    hazard TEXT,
+    invariant TEXT,
+    acceptance_criteria TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_requirements_hazard ON requirements(hazard);
+
+CREATE TABLE IF NOT EXISTS test_cases (
+    req_id TEXT NOT NULL,
+    test_case_id TEXT NOT NULL,
+    title TEXT,
+    body TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (req_id, test_case_id)
+);
+
+CREATE TABLE IF NOT EXISTS test_files (
+    test_name TEXT PRIMARY KEY,
+    req_id TEXT,
+    gs_uri TEXT,
+    sha256 TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_test_files_req ON test_files(req_id);
+
+CREATE TABLE IF NOT EXISTS iso_verdicts (
+    req_id TEXT NOT NULL,
+    test_case_id TEXT NOT NULL DEFAULT '',
+    compliant INTEGER,
+    missing_elements TEXT,
+    related_iso_refs TEXT,
+    suggestions TEXT,
+    validated_at TEXT,
+    PRIMARY KEY (req_id, test_case_id)
+);
+CREATE INDEX IF NOT EXISTS idx_iso_compliant ON iso_verdicts(compliant);
+
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    test_file TEXT,
+    req_id TEXT,
+    hazard TEXT,
+    invariant TEXT,
+    status TEXT,
+    duration_ms INTEGER,
+    ts TEXT,
+    PRIMARY KEY (run_id, test_name)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_req_ts ON runs(req_id, ts);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status);
+CREATE INDEX IF NOT EXISTS idx_runs_hazard ON runs(hazard);
+"""
+
+# Columns added after a table was first released, added in place to older
+# databases before the indexes that use them are created.
+ADDED_COLUMNS = (("runs", "test_file", "TEXT"),)
+
+INDEXES_ON_ADDED_COLUMNS = """
+CREATE INDEX IF NOT EXISTS idx_runs_test_file_ts ON runs(test_file, ts);
+"""
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+def _text(value):
+    """Store lists/dicts as compact JSON, everything else as-is."""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+def test_file_of(test_name: str) -> str:
+    """File name of a pytest node id ("tests/x_test.py::TestA::test_b" -> "x_test.py")."""
+    return os.path.basename(test_name.split("::", 1)[0])
+
+def _test_case_rows(req_id: str, test_cases: list) -> list:
+    now = _now()
+    return [{
+        "req_id": req_id,
+        "test_case_id": str(tc.get("test_case_id") or i),
+        "title": tc.get("title"),
+        "body": tc,
+        "updated_at": now,
+    } for i, tc in enumerate(test_cases) if isinstance(tc, dict)]
+
+def _verdict_rows(verdicts: list) -> list:
+    return [{
+        "req_id": v.get("req_id"),
+        "test_case_id": str(v.get("test_case_id") or ""),
+        "compliant": None if v.get("compliant") is None else int(bool(v.get("compliant"))),
+        "missing_elements": v.get("missing_elements"),
+        "related_iso_refs": v.get("related_iso_refs"),
+        "suggestions": v.get("suggestions"),
+        "validated_at": v.get("validated_at") or _now(),
+    } for v in verdicts if v.get("req_id")]
+
+
+class LocalStore:
+    """Embedded SQLite (WAL) store for requirements, tests, verdicts and runs.
+
+    One connection per thread; WAL mode lets readers proceed while a writer
+    commits, so the request path never waits on BigQuery to answer
+    "which tests exist for req X and when did they last pass".
+    """
+
+    def __init__(self, path: str = LOCAL_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(SCHEMA)
+        self._migrate()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        # A connection must not cross a fork (gunicorn --preload), so key it by pid too.
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _migrate(self):
+        conn = self._conn()
+        for table, column, kind in ADDED_COLUMNS:
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column in existing:
+                continue
+            with conn:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {kind}")
+                if (table, column) == ("runs", "test_file"):
+                    conn.executemany(
+                        "UPDATE runs SET test_file = ? WHERE rowid = ?",
+                        [(test_file_of(r["test_name"]), r["rowid"])
+                         for r in conn.execute("SELECT rowid, test_name FROM runs")],
+                    )
+        conn.executescript(INDEXES_ON_ADDED_COLUMNS)
+
+    def _upsert(self, table: str, rows: list):
+        """Bulk INSERT OR REPLACE of dict rows sharing the same keys."""
+        if not rows:
+            return 0
+        columns = list(rows[0].keys())
+        sql = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        conn = self._conn()
+        params = [tuple(_text(r.get(c)) for c in columns) for r in rows]
+        if getattr(self._local, "in_transaction", False):
+            conn.executemany(sql, params)  # committed by the enclosing transaction()
+        else:
+            with conn:
+                conn.executemany(sql, params)
+        return len(rows)
+
+    @contextmanager
+    def transaction(self):
+        """Commit the writes made in this thread inside the block together, or none of them."""
+        conn = self._conn()
+        self._local.in_transaction = True
+        try:
+            with conn:
+                yield self
+        finally:
+            self._local.in_transaction = False
+
+    def _query(self, sql: str, params=()) -> list:
+        return [dict(r) for r in self._conn().execute(sql, params).fetchall()]
+
+    # ------------ Writes ------------
+    def upsert_requirements(self, rows: list):
+        now = _now()
+        return self._upsert("requirements", [{
+            "req_id": r.get("req_id"),
+            "prompt": r.get("prompt"),
+            "description": r.get("description"),
+            "hazard": r.get("hazard"),
+            "invariant": r.get("invariant"),
+            "acceptance_criteria": r.get("acceptance_criteria"),
+            "updated_at": now,
+        } for r in rows if r.get("req_id")])
+
+    def upsert_test_cases(self, req_id: str, test_cases: list):
+        return self._upsert("test_cases", _test_case_rows(req_id, test_cases))
+
+    def upsert_test_files(self, rows: list):
+        now = _now()
+        return self._upsert("test_files", [{
+            "test_name": r["test_name"],
+            "req_id": r.get("req_id"),
+            "gs_uri": r.get("gs_uri"),
+            "sha256": r.get("sha256"),
+            "updated_at": now,
+        } for r in rows])
+
+    def upsert_iso_verdicts(self, verdicts: list):
+        return self._upsert("iso_verdicts", _verdict_rows(verdicts))
+
+    def replace_results(self, req_id: str, test_cases: list, verdicts: list):
+        """Make these the requirement's only test cases and verdicts, in one transaction.
+
+        A re-normalized requirement can come back with fewer or renumbered
+        test cases; upserting alone would leave the old ones behind.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM test_cases WHERE req_id = ?", (req_id,))
+            conn.execute("DELETE FROM iso_verdicts WHERE req_id = ?", (req_id,))
+            self._upsert("test_cases", _test_case_rows(req_id, test_cases))
+            self._upsert("iso_verdicts", _verdict_rows([{**v, "req_id": req_id} for v in verdicts]))
+
+    def upsert_runs(self, rows: list):
+        return self._upsert("runs", [{
+            "run_id": r["run_id"],
+            "test_name": r["test_name"],
+            "test_file": r.get("test_file") or test_file_of(r["test_name"]),
+            "req_id": r.get("req_id"),
+            "hazard": r.get("hazard"),
+            "invariant": r.get("invariant"),
+            "status": r.get("status"),
+            "duration_ms": r.get("duration_ms"),
+            "ts": r.get("ts") or _now(),
+        } for r in rows])
+
+    # ------------ Reads ------------
+    def get_requirement(self, req_id: str):
+        rows = self._query("SELECT * FROM requirements WHERE req_id = ?", (req_id,))
+        if not rows:
+            return None
+        requirement = rows[0]
+        requirement["test_cases"] = [
+            json.loads(r["body"]) for r in self._query(
+                "SELECT body FROM test_cases WHERE req_id = ? ORDER BY test_case_id", (req_id,)
+            )
+        ]
+        requirement["iso_verdicts"] = self._query(
+            "SELECT * FROM iso_verdicts WHERE req_id = ? ORDER BY test_case_id", (req_id,)
+        )
+        requirement["test_files"] = self.tests_for(req_id)
+        return requirement
+
+    def requirement_prompt(self, req_id: str):
+        """The prompt a stored requirement was normalized from, or None if there is no such row."""
+        rows = self._query("SELECT prompt FROM requirements WHERE req_id = ?", (req_id,))
+        return rows[0]["prompt"] or "" if rows else None
+
+    def find_requirements(self, hazard: str = None, limit: int = 100) -> list:
+        if hazard:
+            return self._query(
+                "SELECT * FROM requirements WHERE hazard = ? ORDER BY updated_at DESC LIMIT ?", (hazard, limit)
+            )
+        return self._query("SELECT * FROM requirements ORDER BY updated_at DESC LIMIT ?", (limit,))
+
+    def tests_for(self, req_id: str) -> list:
+        """Test files for a requirement with their latest run and last pass.
+
+        Runs hold one row per test case, so a file's status in a run is its
+        worst case: last_status is the first non-passing status of the latest
+        run, and last_passed_at the latest run in which no case failed.
+        """
+        return self._query(
+            """
+            SELECT f.test_name, f.gs_uri, f.sha256,
+                   (SELECT status FROM runs r WHERE r.test_file = f.test_name
+                     ORDER BY ts DESC, status = 'passed', status = 'skipped' LIMIT 1) AS last_status,
+                   (SELECT MAX(ts) FROM runs r WHERE r.test_file = f.test_name) AS last_run_at,
+                   (SELECT MAX(ts) FROM runs r WHERE r.test_file = f.test_name AND r.status = 'passed'
+                     AND NOT EXISTS (SELECT 1 FROM runs x WHERE x.run_id = r.run_id
+                                     AND x.test_file = r.test_file
+                                     AND x.status NOT IN ('passed', 'skipped'))) AS last_passed_at
+            FROM test_files f WHERE f.req_id = ? ORDER BY f.test_name
+            """,
+            (req_id,),
+        )
+
+    def find_runs(self, req_id: str = None, hazard: str = None, status: str = None, limit: int = 100) -> list:
+        clauses, params = [], []
+        for column, value in (("req_id", req_id), ("hazard", hazard), ("status", status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(f"SELECT * FROM runs {where} ORDER BY ts DESC LIMIT ?", (*params, limit))
+
+    def iter_run_rows(self, run_id: str, batch_size: int = 1000):
+        """All rows of one run in batches, without the local-only test_file column."""
+        last = ""
+        while True:
+            rows = self._query(
+                "SELECT run_id, test_name, req_id, hazard, invariant, status, duration_ms, ts FROM runs "
+                "WHERE run_id = ? AND test_name > ? ORDER BY test_name LIMIT ?",
+                (run_id, last, batch_size),
+            )
+            if not rows:
+                return
+            yield rows
+            last = rows[-1]["test_name"]
+
+    def list_test_files(self) -> list:
+        return self._query("SELECT * FROM test_files ORDER BY test_name")
+
+    def run_history(self, test_names: list, per_test: int = 10) -> dict:
+        """The last `per_test` runs of each test, newest first, in one query."""
+        if not test_names:
+            return {}
+        history = {name: [] for name in test_names}
+        # Chunked to stay under SQLite's bound-parameter limit on big corpora.
+        for start in range(0, len(test_names), 500):
+            chunk = test_names[start:start + 500]
+            rows = self._query(
+                f"""
+                SELECT test_name, status, duration_ms, ts FROM (
+                    SELECT test_name, status, duration_ms, ts,
+                           ROW_NUMBER() OVER (PARTITION BY test_name ORDER BY ts DESC) AS n
+                    FROM runs WHERE test_name IN ({', '.join('?' for _ in chunk)})
+                ) WHERE n <= ? ORDER BY test_name, ts DESC
+                """,
+                (*chunk, per_test),
+            )
+            for row in rows:
+                history[row["test_name"]].append(row)
+        return history
+
+    def requirement_fields(self, req_ids: list) -> dict:
+        """{req_id: {"hazard", "invariant"}} for the given requirements."""
+        ids = [r for r in set(req_ids) if r]
+        fields = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            for row in self._query(
+                f"SELECT req_id, hazard, invariant FROM requirements WHERE req_id IN ({', '.join('?' for _ in chunk)})",
+                tuple(chunk),
+            ):
+                fields[row["req_id"]] = row
+        return fields
+
+
+class BigQueryReplicator:
+    """Ships rows to BigQuery from a background thread.
+
+    The request path only enqueues; the worker drains whatever is queued for
+    the same table and sends it as one insert, so BigQuery latency and
+    outages never block a response. Failed batches are logged and dropped —
+    the local store stays the source of truth.
+    """
+
+    def __init__(self, insert, max_batch: int = 500):
+        self.insert = insert
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, dataset: str, table: str, rows: list):
+        if not rows:
+            return
+        self._ensure_started()
+        self._queue.put((dataset, table, rows))
+
+    def _ensure_started(self):
+        # Started lazily so a forked worker gets its own thread.
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="bq-replicator", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            dataset, table, rows = self._queue.get()
+            batch = list(rows)
+            pending = []
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item[:2] == (dataset, table):
+                    batch.extend(item[2])
+                else:
+                    pending.append(item)
+            for item in pending:
+                self._queue.put(item)
+            errors = self.insert(dataset, table, batch)
+            if errors:
+                logging.error(f"BigQuery replication to {dataset}.{table} failed: {errors}")
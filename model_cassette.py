@@ -0,0 +1,126 @@
+import os
+import gzip
+import json
+import hashlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; appends are then only thread-safe
+    fcntl = None
+
+# ------------ Config ------------
+# off    - always call the model
+# record - call the model and write every answer to the cassette
+# replay - answer only from the cassette; a miss is an error, never a network call
+# auto   - replay hits, record misses
+MODEL_CASSETTE_MODE = os.getenv("MODEL_CASSETTE_MODE", "off").lower()
+MODEL_CASSETTE_PATH = os.getenv("MODEL_CASSETTE_PATH", "cassettes/model_calls.jsonl.gz")
+
+
+class CassetteMiss(RuntimeError):
+    """Replay mode was asked for a prompt that was never recorded."""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Whitespace differences should not turn a recorded call into a miss."""
+    return " ".join((prompt or "").split())
+
+def cassette_key(model: str, prompt: str) -> str:
+    payload = f"{model}\0{normalize_prompt(prompt)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:32]
+
+
+class Cassette:
+    """Record/replay store for model calls.
+
+    The cassette is gzip-compressed JSONL, one {"key", "model", "prompt",
+    "response"} object per line. New recordings are appended as extra gzip
+    members, which gzip readers treat as one continuous stream, so recording
+    never rewrites the file. Each member is written with a single O_APPEND
+    write under an exclusive flock, so gunicorn workers recording into the
+    same cassette never interleave.
+    """
+
+    def __init__(self, path: str = MODEL_CASSETTE_PATH, mode: str = MODEL_CASSETTE_MODE):
+        if mode not in ("off", "record", "replay", "auto"):
+            raise ValueError(f"Unknown MODEL_CASSETTE_MODE: {mode}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        if mode != "off":
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with gzip.open(self.path, "rt", encoding="utf-8") as fh:
+            for line in fh:
+                entry = json.loads(line)
+                self._entries[entry["key"]] = entry["response"]
+        logging.info(f"Loaded {len(self._entries)} recorded model calls from {self.path}")
+
+    def _append(self, key: str, model: str, prompt: str, response: dict):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        line = json.dumps(
+            {"key": key, "model": model, "prompt": normalize_prompt(prompt), "response": response},
+            separators=(",", ":"),
+        )
+        member = gzip.compress((line + "\n").encode("utf-8"))
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            view = memoryview(member)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)  # also releases the flock
+
+    def call(self, model: str, prompt: str, live) -> dict:
+        """Answer from the cassette or via live(), depending on the mode.
+
+        live() returns the response dict; responses carrying an "error" key
+        are passed through but never recorded.
+        """
+        if self.mode == "off":
+            return live()
+
+        key = cassette_key(model, prompt)
+        if self.mode in ("replay", "auto"):
+            with self._lock:
+                response = self._entries.get(key)
+                if response is not None:
+                    self.hits += 1
+                    return response
+                self.misses += 1
+            if self.mode == "replay":
+                raise CassetteMiss(
+                    f"No recorded model call for key {key} (model={model}, "
+                    f"prompt starts {normalize_prompt(prompt)[:80]!r}) in {self.path}"
+                )
+
+        response = live()
+        if not response.get("error"):
+            with self._lock:
+                self._entries[key] = response
+                self._append(key, model, prompt, response)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "path": self.path,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
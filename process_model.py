@@ -0,0 +1,104 @@
+import os
+import math
+import time
+import threading
+
+# ------------ Per-request CPU vs I/O ------------
+_lock = threading.Lock()
+_totals = {"requests": 0, "cpu_ms": 0.0, "wall_ms": 0.0}
+_request = threading.local()
+
+
+def start_request():
+    _request.cpu = time.thread_time()
+    _request.wall = time.perf_counter()
+
+def finish_request():
+    """Account the current request's CPU time and wall time (the rest is I/O wait)."""
+    if not hasattr(_request, "cpu"):
+        return
+    cpu_ms = (time.thread_time() - _request.cpu) * 1000
+    wall_ms = (time.perf_counter() - _request.wall) * 1000
+    del _request.cpu
+    with _lock:
+        _totals["requests"] += 1
+        _totals["cpu_ms"] += cpu_ms
+        _totals["wall_ms"] += wall_ms
+
+def request_profile() -> dict:
+    """Average CPU and I/O time per request in this worker since startup."""
+    with _lock:
+        n = _totals["requests"]
+        cpu_ms = _totals["cpu_ms"] / n if n else 0.0
+        wall_ms = _totals["wall_ms"] / n if n else 0.0
+    return {
+        "pid": os.getpid(),
+        "requests": n,
+        "avg_cpu_ms": round(cpu_ms, 2),
+        "avg_io_ms": round(max(0.0, wall_ms - cpu_ms), 2),
+        "avg_wall_ms": round(wall_ms, 2),
+    }
+
+# ------------ Sizing ------------
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"  # cgroup v2: "<quota> <period>" or "max <period>"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+
+
+def _read(path: str):
+    try:
+        with open(path, "r") as fh:
+            return fh.read().strip()
+    except OSError:
+        return None
+
+def _cgroup_cpu_limit():
+    """CPUs allowed by the container's CFS quota, or None when unlimited."""
+    cpu_max = _read(CGROUP_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+    else:
+        quota, period = _read(CGROUP_V1_QUOTA), _read(CGROUP_V1_PERIOD)
+    try:
+        quota, period = int(quota), int(period)
+    except (TypeError, ValueError):  # "max", or no cgroup files
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, math.ceil(quota / period))
+
+def available_cpus() -> int:
+    """CPUs this process may actually use.
+
+    os.cpu_count() reports the host's cores; inside a container the CPU
+    affinity mask and the cgroup quota (docker --cpus, Cloud Run, k8s limits)
+    are what bound parallelism.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):  # not available on macOS/Windows
+        count = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    return max(1, min(count, limit) if limit else count)
+
+def recommended_pool(cpu_ms: float, io_ms: float, cpu_count: int = None, max_threads: int = 32) -> dict:
+    """Workers/threads for a request mix of cpu_ms compute and io_ms waiting.
+
+    The GIL lets one thread per process run Python at a time, so CPU
+    parallelism comes from workers (one per core). While a request waits on
+    Gemini/GCS/BigQuery its thread is idle, so each worker needs about
+    1 + io/cpu threads to keep its core busy. More workers than cores only
+    adds memory and splits per-process state; more threads is cheap.
+    """
+    cpu_count = cpu_count or available_cpus()
+    workers = max(1, cpu_count)
+    if cpu_ms <= 0:
+        threads = max_threads
+    else:
+        threads = min(max_threads, max(1, math.ceil(1 + io_ms / cpu_ms)))
+    return {
+        "workers": workers,
+        "threads": threads,
+        "max_concurrent_requests": workers * threads,
+        "basis": {"cpu_count": cpu_count, "cpu_ms": cpu_ms, "io_ms": io_ms},
+    }
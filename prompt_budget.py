@@ -0,0 +1,176 @@
+import os
+import json
+import logging
+import threading
+
+# ------------ Config ------------
+# Gemini tokenizes English/JSON at roughly 4 characters per token. The estimate
+# only has to be good enough to keep prompts under budget before we send them;
+# the exact counts come back in the response's usageMetadata.
+CHARS_PER_TOKEN = 4
+
+DEFAULT_STAGE_BUDGETS = {
+    "classify": 1024,
+    "normalize": 2048,
+    "test_cases": 2048,
+    "iso_validation": 6000,
+    "iso_case": 1500,
+    "general": 8192,
+}
+
+TRUNCATION_MARK = "...[truncated]"
+
+
+def _parse_budgets(raw: str) -> dict:
+    """Parse PROMPT_TOKEN_BUDGETS, e.g. "iso_validation=4000,normalize=1500"."""
+    budgets = {}
+    for item in (raw or "").split(","):
+        if "=" not in item:
+            continue
+        stage, value = item.split("=", 1)
+        try:
+            budgets[stage.strip()] = int(value)
+        except ValueError:
+            logging.warning(f"Ignoring invalid prompt budget: {item}")
+    return budgets
+
+
+STAGE_BUDGETS = {**DEFAULT_STAGE_BUDGETS, **_parse_budgets(os.getenv("PROMPT_TOKEN_BUDGETS", ""))}
+
+# ------------ Serialization ------------
+def compact_json(value) -> str:
+    """Serialize without the whitespace that indent=2 adds to every prompt."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def estimate_tokens(text: str) -> int:
+    return (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def budget_for(stage: str) -> int:
+    return STAGE_BUDGETS.get(stage, STAGE_BUDGETS["general"])
+
+def fit_text(text: str, max_tokens: int) -> str:
+    """Cut free text down to max_tokens, keeping the head of the text."""
+    text = text or ""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARK))
+    return text[:keep] + TRUNCATION_MARK
+
+def _shrink_strings(value, max_chars: int):
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + TRUNCATION_MARK
+    if isinstance(value, list):
+        return [_shrink_strings(v, max_chars) for v in value]
+    if isinstance(value, dict):
+        return {k: _shrink_strings(v, max_chars) for k, v in value.items()}
+    return value
+
+def _omitted(n: int) -> dict:
+    return {"omitted_items": n}
+
+def _trim_list(items: list, max_chars: int) -> list:
+    """Longest prefix of items that, with an omitted-items marker, serializes within max_chars.
+
+    Each item is serialized once; the prefix length is then found by binary
+    search over the cumulative sizes, so trimming is O(n log n) rather than
+    re-encoding the list for every dropped item.
+    """
+    sizes = [len(compact_json(item)) for item in items]
+    # "[" + items joined by "," + "]"
+    if 2 + sum(sizes) + max(len(sizes) - 1, 0) <= max_chars:
+        return items
+    prefix = [0]
+    for size in sizes:
+        prefix.append(prefix[-1] + size)
+
+    def fits(keep: int) -> bool:
+        marker = len(compact_json(_omitted(len(items) - keep)))
+        return 2 + prefix[keep] + keep + marker <= max_chars
+
+    lo, hi = 1, len(items) - 1  # at least one item is always kept
+    keep = 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if fits(mid):
+            keep, lo = mid, mid + 1
+        else:
+            hi = mid - 1
+    return items[:keep] + [_omitted(len(items) - keep)]
+
+def _trim(value, max_chars: int):
+    """Drop trailing list items until value fits; for a dict, trim its largest list/dict member."""
+    if isinstance(value, list):
+        return _trim_list(value, max_chars)
+    if isinstance(value, dict):
+        nested = [k for k, v in value.items() if isinstance(v, (list, dict)) and v]
+        if not nested:
+            return value
+        key = max(nested, key=lambda k: len(compact_json(value[k])))
+        # Everything but that member, with an empty placeholder ("[]" / "{}") in its place.
+        rest = len(compact_json({**value, key: type(value[key])()})) - 2
+        return {**value, key: _trim(value[key], max(max_chars - rest, 2))}
+    return value
+
+def fit_json(value, max_tokens: int) -> str:
+    """Compactly serialize value and bring it under max_tokens.
+
+    Long string fields are shortened first (steps, expected results and
+    suggestions are where the models ramble), then trailing list items are
+    replaced with an {"omitted_items": n} summary — also for a list wrapped
+    in a dict such as {"test_cases": [...]}. Only if that still does not fit
+    is the serialized text itself cut.
+    """
+    text = compact_json(value)
+    max_chars = 1024
+    while estimate_tokens(text) > max_tokens and max_chars >= 64:
+        value = _shrink_strings(value, max_chars)
+        text = compact_json(value)
+        max_chars //= 2
+
+    if estimate_tokens(text) > max_tokens and isinstance(value, (list, dict)):
+        text = compact_json(_trim(value, max_tokens * CHARS_PER_TOKEN))
+
+    return fit_text(text, max_tokens)
+
+# ------------ Stage metrics ------------
+_stats_lock = threading.Lock()
+_stage_stats = {}
+
+def record_stage(stage: str, estimated_input_tokens: int, input_tokens: int,
+                 output_tokens: int, latency_ms: float):
+    """Accumulate prompt size and latency for one model call of a stage."""
+    with _stats_lock:
+        s = _stage_stats.setdefault(stage, {
+            "calls": 0,
+            "estimated_input_tokens": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "max_input_tokens": 0,
+            "latency_ms": 0.0,
+        })
+        s["calls"] += 1
+        s["estimated_input_tokens"] += estimated_input_tokens
+        s["input_tokens"] += input_tokens
+        s["output_tokens"] += output_tokens
+        s["max_input_tokens"] = max(s["max_input_tokens"], input_tokens or estimated_input_tokens)
+        s["latency_ms"] += latency_ms
+    logging.info(
+        f"stage={stage} input_tokens={input_tokens} (est {estimated_input_tokens}) "
+        f"output_tokens={output_tokens} latency_ms={latency_ms:.1f}"
+    )
+
+def stage_stats() -> dict:
+    """Snapshot of per-stage totals plus per-call averages."""
+    with _stats_lock:
+        snapshot = {k: dict(v) for k, v in _stage_stats.items()}
+    for stage, s in snapshot.items():
+        calls = s["calls"] or 1
+        s["avg_input_tokens"] = s["input_tokens"] / calls
+        s["avg_output_tokens"] = s["output_tokens"] / calls
+        s["avg_latency_ms"] = s["latency_ms"] / calls
+        s["budget"] = budget_for(stage)
+    return snapshot
+
+def reset_stage_stats():
+    with _stats_lock:
+        _stage_stats.clear()
@@ -0,0 +1,214 @@
+import os
+import re
+import zlib
+import random
+import hashlib
+import logging
+import threading
+from string import Formatter
+
+from prompt_budget import estimate_tokens
+
+# ------------ Config ------------
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+# A/B routing, e.g. "classify=v1:90,v2:10;normalize=v2". Templates without a
+# route use their highest version.
+PROMPT_AB = os.getenv("PROMPT_AB", "")
+
+TEMPLATE_FILE_RE = re.compile(r"^(?P<name>[a-z0-9_]+)\.(?P<version>v\d+)\.txt$")
+
+
+class RenderedPrompt(str):
+    """A prompt string that remembers which template version produced it."""
+
+    def __new__(cls, text: str, template: "PromptTemplate"):
+        obj = super().__new__(cls, text)
+        obj.template = template
+        return obj
+
+
+class PromptTemplate:
+    """One prompt version, parsed once into literal/field pieces.
+
+    Templates use str.format field syntax ({name}, {{ for a literal brace})
+    but only plain names, so rendering is a join over the precompiled pieces
+    with no per-call parsing.
+    """
+
+    def __init__(self, name: str, version: str, text: str):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.sha = hashlib.sha1(text.encode("utf-8")).hexdigest()[:10]
+        parts = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if field is not None and (not field.isidentifier() or spec or conversion):
+                raise ValueError(f"Prompt {name}.{version}: only plain {{name}} fields are supported, got {{{field}}}")
+            parts.append((literal, field))
+        self._parts = tuple(parts)
+        self.fields = frozenset(f for _, f in parts if f is not None)
+        # Size of the fixed instructions, for fitting the variable parts into a budget.
+        self.static_tokens = estimate_tokens("".join(literal for literal, _ in parts))
+
+    def render(self, **values) -> RenderedPrompt:
+        missing = self.fields - values.keys()
+        if missing:
+            raise KeyError(f"Prompt {self.name}.{self.version} needs {', '.join(sorted(missing))}")
+        out = []
+        for literal, field in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(str(values[field]))
+        return RenderedPrompt("".join(out), self)
+
+
+def _template_of(prompt):
+    return prompt if isinstance(prompt, PromptTemplate) else getattr(prompt, "template", None)
+
+def _empty_stats() -> dict:
+    return {"calls": 0, "errors": 0, "input_tokens": 0, "latency_ms": 0.0, "parsed": 0, "parse_failed": 0}
+
+def _parse_routes(raw: str) -> dict:
+    """PROMPT_AB -> {name: [(version, weight), ...]}."""
+    routes = {}
+    for item in (raw or "").split(";"):
+        if "=" not in item:
+            continue
+        name, spec = item.split("=", 1)
+        weighted = []
+        for choice in spec.split(","):
+            version, _, weight = choice.strip().partition(":")
+            try:
+                weighted.append((version.strip(), int(weight) if weight else 1))
+            except ValueError:
+                logging.warning(f"Ignoring invalid prompt route: {item}")
+        if weighted:
+            routes[name.strip()] = weighted
+    return routes
+
+
+class PromptRegistry:
+    """Versioned prompt templates loaded once from PROMPTS_DIR (<name>.v<N>.txt).
+
+    `render(name, key=..., **values)` picks a version (A/B routed by
+    PROMPT_AB) and fills it in. Routing hashes `key`, so the same input always
+    gets the same version: answers stay cacheable and cassette-replayable.
+    Per-version input tokens, latency and JSON parse success are recorded
+    against the RenderedPrompt that went to the model.
+    """
+
+    def __init__(self, directory: str = PROMPTS_DIR, routes: str = PROMPT_AB):
+        self.directory = directory
+        self.templates = {}
+        self.routes = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.load(directory)
+        self.set_routes(routes)
+
+    def load(self, directory: str):
+        if not os.path.isdir(directory):
+            logging.warning(f"Prompt directory {directory} not found")
+            return
+        for filename in sorted(os.listdir(directory)):
+            match = TEMPLATE_FILE_RE.match(filename)
+            if not match:
+                continue
+            with open(os.path.join(directory, filename), "r", encoding="utf-8") as fh:
+                text = fh.read()
+            if text.endswith("\n"):
+                text = text[:-1]
+            template = PromptTemplate(match["name"], match["version"], text)
+            self.templates.setdefault(template.name, {})[template.version] = template
+
+    def set_routes(self, raw: str):
+        routes = _parse_routes(raw)
+        for name, weighted in routes.items():
+            unknown = [v for v, _ in weighted if v not in self.templates.get(name, {})]
+            if unknown:
+                raise ValueError(f"PROMPT_AB routes {name} to unknown versions: {', '.join(unknown)}")
+        self.routes = routes
+
+    def versions(self, name: str) -> list:
+        return sorted(self.templates.get(name, {}), key=lambda v: int(v[1:]))
+
+    def get(self, name: str, version: str = None) -> PromptTemplate:
+        versions = self.templates.get(name)
+        if not versions:
+            raise KeyError(f"No prompt template named {name} in {self.directory}")
+        return versions[version or self.versions(name)[-1]]
+
+    def choose(self, name: str, key: str = None) -> PromptTemplate:
+        weighted = self.routes.get(name)
+        if not weighted:
+            return self.get(name)
+        total = sum(w for _, w in weighted)
+        if key is None:
+            point = random.randrange(total)
+        else:
+            point = zlib.crc32(f"{name}\0{key}".encode("utf-8")) % total
+        for version, weight in weighted:
+            if point < weight:
+                return self.get(name, version)
+            point -= weight
+        return self.get(name, weighted[-1][0])
+
+    def render(self, name: str, key: str = None, **values) -> RenderedPrompt:
+        return self.choose(name, key).render(**values)
+
+    # ------------ Stats ------------
+    def _entry(self, template: PromptTemplate) -> dict:
+        return self._stats.setdefault((template.name, template.version), _empty_stats())
+
+    def record_call(self, prompt, input_tokens: int, latency_ms: float, error: bool = False):
+        """Account one model call; a plain str (no template) is ignored."""
+        template = _template_of(prompt)
+        if template is None:
+            return
+        with self._lock:
+            s = self._entry(template)
+            s["calls"] += 1
+            s["errors"] += int(error)
+            s["input_tokens"] += input_tokens
+            s["latency_ms"] += latency_ms
+
+    def record_parse(self, prompt, ok: bool):
+        template = _template_of(prompt)
+        if template is None:
+            return
+        with self._lock:
+            self._entry(template)["parsed" if ok else "parse_failed"] += 1
+
+    def stats(self) -> dict:
+        """{name: {version: totals + averages}} plus the active routing."""
+        with self._lock:
+            snapshot = {k: dict(v) for k, v in self._stats.items()}
+        report = {}
+        for name in sorted(self.templates):
+            versions = {}
+            for version in self.versions(name):
+                template = self.templates[name][version]
+                s = snapshot.get((name, version), _empty_stats())
+                calls = s["calls"] or 1
+                attempts = s["parsed"] + s["parse_failed"]
+                versions[version] = {
+                    **s,
+                    "sha": template.sha,
+                    "static_tokens": template.static_tokens,
+                    "avg_input_tokens": s["input_tokens"] / calls,
+                    "avg_latency_ms": s["latency_ms"] / calls,
+                    "json_parse_rate": s["parsed"] / attempts if attempts else None,
+                }
+            report[name] = {
+                "default": self.versions(name)[-1],
+                "route": self.routes.get(name),
+                "versions": versions,
+            }
+        return report
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+prompt_templates = PromptRegistry()
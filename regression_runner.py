@@ -0,0 +1,382 @@
+"""Scheduled regression run over every stored generated test.
+
+Collects the generated pytest files (the local store's test_files table,
+downloaded from GCS and cached by content hash, plus any --tests-dir), runs
+them in parallel subprocesses with a timeout and memory/CPU limits, reruns
+failures to tell flakes from real failures, bulk-records one row per test
+case (read from each run's JUnit XML) in the local store (and BigQuery with
+--bigquery) and flags tests whose duration regressed against their recent
+history or whose outcome keeps flipping.
+
+    python regression_runner.py --once --tests-dir generated_tests --output nightly.json
+    python regression_runner.py --at 02:00 --jobs 8 --reruns 2 --bigquery
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import logging
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from local_store import LocalStore
+from process_model import available_cpus
+from generated_code_check import check_test_code
+from junit_results import case_req_id, iter_cases, req_id_from_name, req_ids_from_source
+
+try:
+    import resource
+except ImportError:  # not available on Windows; limits are skipped there
+    resource = None
+
+# ------------ Config ------------
+REGRESSION_CACHE_DIR = os.getenv("REGRESSION_CACHE_DIR", "/tmp/regression_tests")
+TEST_FILE_RE = re.compile(r"(^test_.*|.*_test)\.py$")
+FAILING = ("failed", "error", "timeout")
+OUTPUT_TAIL_CHARS = 2000
+
+
+# ------------ Collection ------------
+def _download_gcs(gs_uri: str, dest: str):
+    from google.cloud import storage
+
+    bucket, _, path = gs_uri[len("gs://"):].partition("/")
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    storage.Client(project=os.getenv("GOOGLE_CLOUD_PROJECT")).bucket(bucket).blob(path).download_to_filename(dest)
+
+def collect_tests(store: LocalStore, tests_dirs: list, use_store: bool = True,
+                  cache_dir: str = REGRESSION_CACHE_DIR) -> list:
+    """[{"test_name", "path", "req_id"}] for every test file to run.
+
+    Stored files are fetched once per content hash, so a nightly run only
+    downloads tests that were added or regenerated since the last one.
+    """
+    tests = {}
+    if use_store:
+        for row in store.list_test_files():
+            if not (row.get("gs_uri") or "").startswith("gs://"):
+                continue
+            folder = row.get("sha256") or "latest"
+            path = os.path.join(cache_dir, folder, row["test_name"])
+            try:
+                if not row.get("sha256") or not os.path.exists(path):
+                    _download_gcs(row["gs_uri"], path)
+            except Exception as e:
+                logging.error(f"Cannot fetch {row['gs_uri']}: {e}")
+                continue
+            tests[row["test_name"]] = {
+                "test_name": row["test_name"],
+                "path": path,
+                "req_id": row.get("req_id") or req_id_from_name(row["test_name"]),
+            }
+    for tests_dir in tests_dirs:
+        for root, dirs, files in os.walk(tests_dir):
+            dirs[:] = [d for d in dirs if not d.startswith((".", "__"))]
+            for name in sorted(files):
+                if TEST_FILE_RE.match(name):
+                    tests.setdefault(name, {
+                        "test_name": name,
+                        "path": os.path.join(root, name),
+                        "req_id": req_id_from_name(name),
+                    })
+    return sorted(tests.values(), key=lambda t: t["test_name"])
+
+
+# ------------ Execution ------------
+# Sets the limits inside the child and then execs the real command. Unlike a
+# preexec_fn this is safe while other threads of the runner are starting
+# processes too.
+_LIMITS_WRAPPER = """\
+import os, sys, resource
+memory_mb, cpu_seconds = int(sys.argv[1]), int(sys.argv[2])
+if memory_mb:
+    resource.setrlimit(resource.RLIMIT_AS, (memory_mb * 1024 * 1024, memory_mb * 1024 * 1024))
+if cpu_seconds:
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+os.execv(sys.argv[3], sys.argv[3:])
+"""
+
+def _limited(cmd: list, memory_mb: int, cpu_seconds: int) -> list:
+    """`cmd` run with the child's address space and CPU time capped."""
+    if resource is None:
+        return cmd
+    return [sys.executable, "-c", _LIMITS_WRAPPER, str(memory_mb or 0), str(cpu_seconds or 0), *cmd]
+
+def _runnable_path(test: dict, work_dir: str):
+    """(path pytest can run, code, errors): the file itself, or its extracted code if it still has Markdown around it."""
+    with open(test["path"], "r", encoding="utf-8", errors="replace") as fh:
+        source = fh.read()
+    # Imports may resolve next to the test file; the pytest run itself reports those that don't.
+    check = check_test_code(source, check_imports=False)
+    if not check["ok"]:
+        return None, source, check["errors"]
+    if check["code"].strip() == source.strip():
+        return test["path"], source, []
+    os.makedirs(work_dir, exist_ok=True)
+    path = os.path.join(work_dir, test["test_name"])
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(check["code"])
+    return path, check["code"], []
+
+def run_pytest(path: str, timeout: float, memory_mb: int, junit_path: str) -> dict:
+    """One isolated pytest run of one file: status, duration_ms, output tail and per-case results."""
+    cmd = [sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", f"--junitxml={junit_path}",
+           os.path.basename(path)]
+    started = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            _limited(cmd, memory_mb, int(timeout) + 5), cwd=os.path.dirname(os.path.abspath(path)),
+            capture_output=True, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"status": "timeout", "duration_ms": int(timeout * 1000), "output": "", "cases": []}
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    # pytest exit codes: 0 all passed, 1 some failed, anything else is a collection/usage error.
+    status = {0: "passed", 1: "failed"}.get(proc.returncode, "error")
+    output = (proc.stdout + proc.stderr)[-OUTPUT_TAIL_CHARS:]
+    try:
+        cases = list(iter_cases(junit_path))
+    except (OSError, SyntaxError):  # no report, or a truncated one from a killed run
+        cases = []
+    return {"status": status, "duration_ms": duration_ms, "output": output, "cases": cases}
+
+def run_with_reruns(test: dict, reruns: int, timeout: float, memory_mb: int, work_dir: str) -> list:
+    """Run a test file, rerunning it while it fails, up to `reruns` times.
+
+    Returns one record per test case of the first attempt. A case that fails
+    and then passes on a rerun is reported "flaky"; one that fails every
+    attempt keeps its first failing status. Durations are the first
+    attempt's, so reruns don't distort the duration trend. When the file
+    produced no cases (timeout, collection error) one file-level record is
+    returned instead.
+    """
+    try:
+        path, code, errors = _runnable_path(test, work_dir)
+    except OSError as e:
+        path, code, errors = None, "", [str(e)]
+    if path is None:
+        return [{**test, "status": "invalid", "duration_ms": 0, "attempts": 0, "output": "; ".join(errors)}]
+
+    os.makedirs(work_dir, exist_ok=True)
+    junit_base = os.path.join(work_dir, test["test_name"])
+    attempts = [run_pytest(path, timeout, memory_mb, f"{junit_base}.1.xml")]
+    while attempts[-1]["status"] in FAILING and len(attempts) <= reruns:
+        attempts.append(run_pytest(path, timeout, memory_mb, f"{junit_base}.{len(attempts) + 1}.xml"))
+    first = attempts[0]
+
+    if not first["cases"]:
+        recovered = first["status"] in FAILING and attempts[-1]["status"] == "passed"
+        return [{
+            **test,
+            "status": "flaky" if recovered else first["status"],
+            "duration_ms": first["duration_ms"],
+            "attempts": len(attempts),
+            "output": "" if first["status"] == "passed" else first["output"],
+        }]
+
+    passed_later = {c["nodeid"] for a in attempts[1:] for c in a["cases"] if c["status"] == "passed"}
+    req_ids = req_ids_from_source(code)
+    records = []
+    for case in first["cases"]:
+        status = case["status"]
+        if status in FAILING and case["nodeid"] in passed_later:
+            status = "flaky"
+        records.append({
+            "test_name": case["nodeid"],
+            "path": test["path"],
+            "req_id": case_req_id(case, req_ids, test["req_id"]),
+            "status": status,
+            "duration_ms": case["duration_ms"],
+            "attempts": len(attempts),
+            "output": "" if status == "passed" else case["message"] or "",
+        })
+    return records
+
+
+# ------------ Trend analysis ------------
+def duration_regression(duration_ms: int, history: list, tolerance: float, min_delta_ms: int,
+                        min_history: int = 3):
+    """Baseline info if duration_ms is well above the median of recent passing runs, else None."""
+    if duration_ms is None:
+        return None
+    past = [h["duration_ms"] for h in history if h["status"] == "passed" and h["duration_ms"] is not None]
+    if len(past) < min_history:
+        return None
+    median = statistics.median(past)
+    if duration_ms > median * (1 + tolerance) and duration_ms - median >= min_delta_ms:
+        return {"median_ms": int(median), "duration_ms": duration_ms, "ratio": round(duration_ms / max(median, 1), 2)}
+    return None
+
+def outcome_flips(statuses: list) -> int:
+    """Pass<->fail transitions in a newest-first status list ("flaky" counts as a flip by itself)."""
+    outcomes = ["pass" if s == "passed" else "fail" for s in statuses if s not in ("invalid", "skipped")]
+    flips = sum(1 for a, b in zip(outcomes, outcomes[1:]) if a != b)
+    return flips + sum(1 for s in statuses if s == "flaky")
+
+
+# ------------ Run ------------
+def run_regression(store: LocalStore, tests: list, jobs: int, reruns: int, timeout: float, memory_mb: int,
+                   history_window: int = 10, tolerance: float = 0.5, min_delta_ms: int = 100,
+                   flaky_flips: int = 2, bq_insert=None) -> dict:
+    run_id = datetime.utcnow().strftime("nightly_%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+    started = time.perf_counter()
+    work_dir = os.path.join(REGRESSION_CACHE_DIR, "work", run_id)
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        results = [
+            record
+            for records in pool.map(lambda t: run_with_reruns(t, reruns, timeout, memory_mb, work_dir), tests)
+            for record in records
+        ]
+    # History is read before this run is written so it is the baseline, not the sample.
+    history = store.run_history([r["test_name"] for r in results], per_test=history_window)
+
+    fields = store.requirement_fields([r["req_id"] for r in results])
+    ts = datetime.utcnow().isoformat()
+    rows = [{
+        "run_id": run_id,
+        "test_name": r["test_name"],
+        "req_id": r["req_id"],
+        "hazard": fields.get(r["req_id"], {}).get("hazard"),
+        "invariant": fields.get(r["req_id"], {}).get("invariant"),
+        "status": r["status"],
+        "duration_ms": r["duration_ms"],
+        "ts": ts,
+    } for r in results]
+    store.upsert_runs(rows)
+    if bq_insert is not None:
+        for start in range(0, len(rows), 500):
+            errors = bq_insert("qa_metrics", "test_results", rows[start:start + 500])
+            if errors:
+                logging.error(f"BigQuery insert for {run_id} failed: {errors}")
+
+    regressions, flaky, failures = [], [], []
+    for r in results:
+        past = history.get(r["test_name"], [])
+        if r["status"] == "passed":
+            slower = duration_regression(r["duration_ms"], past, tolerance, min_delta_ms)
+            if slower:
+                regressions.append({"test_name": r["test_name"], "req_id": r["req_id"], **slower})
+        flips = outcome_flips([r["status"]] + [h["status"] for h in past])
+        if r["status"] == "flaky" or flips >= flaky_flips:
+            flaky.append({"test_name": r["test_name"], "req_id": r["req_id"], "status": r["status"],
+                          "flips": flips, "window": len(past) + 1})
+        if r["status"] in FAILING + ("invalid",):
+            failures.append({"test_name": r["test_name"], "req_id": r["req_id"], "status": r["status"],
+                             "attempts": r["attempts"], "output": r["output"]})
+
+    totals = {}
+    for r in results:
+        totals[r["status"]] = totals.get(r["status"], 0) + 1
+    return {
+        "run_id": run_id,
+        "ts": ts,
+        "files": len(tests),
+        "tests": len(results),
+        "totals": totals,
+        "wall_ms": int((time.perf_counter() - started) * 1000),
+        "test_ms": sum(r["duration_ms"] or 0 for r in results),
+        "regressions": regressions,
+        "flaky": flaky,
+        "failures": failures,
+    }
+
+
+# ------------ Scheduling ------------
+def parse_interval(text: str) -> float:
+    """Seconds in "90", "30m", "6h" or "1d"."""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def seconds_until(at: str, now: datetime = None) -> float:
+    """Seconds until the next HH:MM (UTC)."""
+    now = now or datetime.utcnow()
+    hour, minute = (int(x) for x in at.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+def bigquery_inserter():
+    from google.cloud import bigquery
+
+    project = os.getenv("GOOGLE_CLOUD_PROJECT")
+    endpoint = os.getenv("BIGQUERY_API_ENDPOINT")
+    client = bigquery.Client(
+        project=project, client_options={"api_endpoint": endpoint} if endpoint else None,
+    )
+
+    def insert(dataset, table, rows):
+        try:
+            return client.insert_rows_json(f"{project}.{dataset}.{table}", rows)
+        except Exception as e:
+            return [{"error": str(e)}]
+    return insert
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    when = parser.add_mutually_exclusive_group()
+    when.add_argument("--once", action="store_true", help="run once and exit (the default)")
+    when.add_argument("--every", help="repeat at this interval, e.g. 6h or 1d")
+    when.add_argument("--at", help="run daily at HH:MM UTC")
+    parser.add_argument("--tests-dir", action="append", default=[], help="also run test files under this directory")
+    parser.add_argument("--no-store", action="store_true", help="skip the test files recorded in the local store")
+    parser.add_argument("--jobs", type=int, default=available_cpus(), help="tests run in parallel")
+    parser.add_argument("--reruns", type=int, default=2, help="reruns of a failing test before it counts as failed")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds per test file attempt")
+    parser.add_argument("--memory-mb", type=int, default=1024, help="address-space limit per test process")
+    parser.add_argument("--history", type=int, default=10, help="past runs per test used as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="flag runs slower than median * (1 + this)")
+    parser.add_argument("--min-delta-ms", type=int, default=100, help="ignore slowdowns smaller than this")
+    parser.add_argument("--flaky-flips", type=int, default=2, help="pass/fail flips in the window that mark a test flaky")
+    parser.add_argument("--bigquery", action="store_true", help="also insert rows into qa_metrics.test_results")
+    parser.add_argument("--output", help="write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(message)s")
+    store = LocalStore()
+    bq_insert = bigquery_inserter() if args.bigquery else None
+
+    def run_once() -> dict:
+        tests = collect_tests(store, args.tests_dir, use_store=not args.no_store)
+        logging.info(f"Running {len(tests)} test files with {args.jobs} jobs")
+        report = run_regression(
+            store, tests, args.jobs, args.reruns, args.timeout, args.memory_mb,
+            history_window=args.history, tolerance=args.tolerance, min_delta_ms=args.min_delta_ms,
+            flaky_flips=args.flaky_flips, bq_insert=bq_insert,
+        )
+        text = json.dumps(report, indent=2)
+        print(text)
+        if args.output:
+            with open(args.output, "w") as fh:
+                fh.write(text)
+        return report
+
+    if not (args.every or args.at):
+        report = run_once()
+        sys.exit(1 if report["failures"] else 0)
+
+    while True:
+        if args.at:
+            wait = seconds_until(args.at)
+            logging.info(f"Next regression run in {int(wait)}s")
+            time.sleep(wait)
+        try:
+            run_once()
+        except Exception as e:
+            logging.exception(f"Regression run failed: {e}")
+        if args.every:
+            time.sleep(parse_interval(args.every))
+
+
+if __name__ == "__main__":
+    main()
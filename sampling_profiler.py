@@ -0,0 +1,100 @@
+import os
+import sys
+import math
+import time
+import threading
+from collections import Counter
+
+# ------------ Config ------------
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MAX_STACK_DEPTH = 128
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _collapse(frame) -> str:
+    """Root-first ';'-joined stack of a frame, the collapsed-stack format flamegraph tools read."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class Sampler:
+    """Wall-clock sampling profiler over the threads of this process.
+
+    A background thread snapshots every thread's stack with
+    sys._current_frames() each `interval_ms` and counts identical stacks, so
+    the sampled code runs unmodified: no tracing hooks, and the cost is one
+    stack walk per thread per tick. Threads waiting on I/O are sampled too,
+    which is what shows where request time actually goes. With `thread_id`
+    only that thread is sampled (per-request profiling); threads in
+    `exclude` are skipped.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, thread_id: int = None, exclude=()):
+        if not math.isfinite(interval_ms):
+            raise ValueError(f"interval_ms must be a finite number, got {interval_ms}")
+        self.interval = max(interval_ms, 1.0) / 1000
+        self.thread_id = thread_id
+        self.exclude = set(exclude)
+        self.samples = 0
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+        self._elapsed = 0.0
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frames = {self.thread_id: frames[self.thread_id]} if self.thread_id in frames else {}
+            for ident, frame in frames.items():
+                if ident == own or ident in self.exclude:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.counts[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """One "frame;frame;... count" line per distinct stack, most frequent first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+    def summary(self) -> dict:
+        return {
+            "samples": self.samples,
+            "stacks": len(self.counts),
+            "interval_ms": self.interval * 1000,
+            "elapsed_s": round(self._elapsed, 3),
+        }
+
+
+def profile_for(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> Sampler:
+    """Sample every other thread of this worker for `seconds` (capped at PROFILE_MAX_SECONDS)."""
+    # min()/max() pass NaN through, and time.sleep(nan) raises; infinity would be capped silently.
+    if not math.isfinite(seconds):
+        raise ValueError(f"seconds must be a finite number, got {seconds}")
+    sampler = Sampler(interval_ms, exclude=(threading.get_ident(),)).start()
+    time.sleep(min(max(seconds, 0.1), PROFILE_MAX_SECONDS))
+    return sampler.stop()
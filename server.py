@@ -1,24 +1,79 @@
+import io
 import os
 import sys
 import json
+import uuid
+import hmac
+import base64
+import shutil
+import tempfile
 import requests
 import logging
+import time
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify
+import xml.etree.ElementTree as ET
+from flask import Flask, g, request, jsonify
 from werkzeug.utils import secure_filename
+from requests.adapters import HTTPAdapter
 from google.auth import default
+from google.auth.credentials import AnonymousCredentials
 from google.auth.transport.requests import Request
 from google.cloud import storage, bigquery
 from flask_cors import CORS
 
+from prompt_budget import (
+    budget_for,
+    estimate_tokens,
+    fit_json,
+    fit_text,
+    record_stage,
+    stage_stats,
+)
+from iso_audit import (
+    ISO_VALIDATION_MODE,
+    as_case_list,
+    build_batch_prompt,
+    to_verdict_list,
+    validate_per_case,
+)
+from local_store import BigQueryReplicator, LocalStore
+from artifact_store import ArtifactStore
+from model_cassette import Cassette, CassetteMiss
+from generated_code_check import check_test_code
+from shared_cache import LocalCache, make_cache
+from fast_response import respond
+from doc_ingest import job_status, start_ingest
+from junit_results import ingest_junit, req_id_from_name, req_ids_from_source
+from prompt_registry import prompt_templates
+from sampling_profiler import PROFILE_INTERVAL_MS, Sampler, profile_for
+from process_model import finish_request, recommended_pool, request_profile, start_request
+from similarity_index import (
+    SIMILARITY_FEWSHOT_THRESHOLD,
+    SIMILARITY_REUSE,
+    SimilarityIndex,
+    prompt_key,
+)
+
 # ------------ Config ------------
 PROJECT_ID = os.getenv("PROJECT_ID", "healthcaretestcasegeneration")
 REGION = os.getenv("REGION", "us-central1")
 DEFAULT_BUCKET = os.getenv("ASSETS_BUCKET", "hackathon-assets-team1-healthcaretestcasegeneration")
+SIMILARITY_EMBEDDINGS = os.getenv("SIMILARITY_EMBEDDINGS", "false").lower() == "true"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-004")
+
+# Endpoint overrides so the backend can run against local stand-ins (see benchmark.py).
+# GCS honours STORAGE_EMULATOR_HOST natively.
+VERTEX_API_BASE = os.getenv("VERTEX_API_BASE", f"https://{REGION}-aiplatform.googleapis.com")
+BIGQUERY_API_ENDPOINT = os.getenv("BIGQUERY_API_ENDPOINT")
+ANONYMOUS_CREDENTIALS = os.getenv("ANONYMOUS_CREDENTIALS", "false").lower() == "true"
+# /admin/* endpoints and X-Profile request profiling are disabled unless this is set.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
 
 # ------------ Logging ------------
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("LOG_LEVEL", "DEBUG"),
     stream=sys.stderr,
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
@@ -43,12 +98,61 @@ CORS(app, resources={r"/*": {"origins": "*"}})
 #)
 
 # ------------ Helpers ------------
+model_cassette = Cassette()
+
+# Process-bound clients are created lazily and re-created after a fork, so the
+# app can be imported once in the gunicorn master (--preload).
+_process_state = {"pid": None, "credentials": None, "session": None}
+_process_lock = threading.Lock()
+# Serializes credential refreshes only; never held while _process_lock is.
+_token_refresh_lock = threading.Lock()
+# The bearer token stays in this process's memory: a secret never goes to the
+# shared cache file, whatever CACHE_BACKEND says.
+_token_cache = LocalCache("auth", 4)
+
+def _process_local():
+    with _process_lock:
+        if _process_state["pid"] != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _process_state.update({"pid": os.getpid(), "credentials": None, "session": session})
+        return _process_state
+
+def http_session() -> requests.Session:
+    """Keep-alive connection pool for model/API calls, one per worker process."""
+    return _process_local()["session"]
+
 def get_adc_access_token():
-    creds, _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-    creds.refresh(Request())
-    return creds.token
+    if ANONYMOUS_CREDENTIALS:
+        return "anonymous"
+    token = _token_cache.get("adc")
+    if token:
+        return token
+
+    state = _process_local()
+    # The refresh is a network round trip: do it under its own lock so threads
+    # that only need the HTTP session are not stalled behind it.
+    with _token_refresh_lock:
+        if state["credentials"] is None:
+            state["credentials"], _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
+        creds = state["credentials"]
+        if not creds.valid:
+            creds.refresh(Request())
+        token = creds.token
+        # Refresh five minutes before expiry.
+        ttl = (creds.expiry - datetime.utcnow()).total_seconds() - 300 if creds.expiry else 300
+    _token_cache.set("adc", token, ttl=max(60, ttl))
+    return token
 
 def bq_client():
+    if BIGQUERY_API_ENDPOINT:
+        return bigquery.Client(
+            project=PROJECT_ID,
+            credentials=AnonymousCredentials() if ANONYMOUS_CREDENTIALS else None,
+            client_options={"api_endpoint": BIGQUERY_API_ENDPOINT},
+        )
     return bigquery.Client(project=PROJECT_ID)
 
 def gcs_client():
@@ -89,11 +193,12 @@ def extract_json(text: str):
         except Exception:
             return {}
 
-def gemini_generate_text(prompt: str) -> dict:
-    """Call Gemini model with given prompt and return text response."""
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash-lite")
+
+def gemini_post(prompt: str, model_id: str = GEMINI_MODEL) -> dict:
+    """One generateContent round trip; returns {"text", "usage"} or {"error"}."""
     access_token = get_adc_access_token()
-    model_id = "gemini-2.5-flash-lite"
-    url = f"https://{REGION}-aiplatform.googleapis.com/v1/projects/{PROJECT_ID}/locations/{REGION}/publishers/google/models/{model_id}:generateContent"
+    url = f"{VERTEX_API_BASE}/v1/projects/{PROJECT_ID}/locations/{REGION}/publishers/google/models/{model_id}:generateContent"
 
     body = {
         "contents": [{"role": "user", "parts": [{"text": prompt}]}],
@@ -101,17 +206,68 @@ def gemini_generate_text(prompt: str) -> dict:
     }
     headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
     logging.debug(f"Gemini request: {body}")
-    resp = requests.post(url, headers=headers, json=body, timeout=120)
+    resp = http_session().post(url, headers=headers, json=body, timeout=120)
 
     if resp.status_code != 200:
-        logging.error(f"Gemini error: {resp.text}")
-        return {"text": f"Error: {resp.text}"}
+        return {"error": resp.text}
 
     data = resp.json()
     text = data.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+    return {"text": text, "usage": data.get("usageMetadata", {})}
+
+def gemini_generate_text(prompt: str, stage: str = "general") -> dict:
+    """Call Gemini model with given prompt and return text response.
+
+    Input/output token counts and latency are recorded under `stage`. With
+    MODEL_CASSETTE_MODE set, calls are recorded to / replayed from the cassette.
+    """
+    estimated_tokens = estimate_tokens(prompt)
+    started = time.perf_counter()
+    try:
+        answer = model_cassette.call(GEMINI_MODEL, prompt, lambda: gemini_post(prompt))
+    except CassetteMiss as e:
+        logging.error(f"Model cassette miss ({stage}): {e}")
+        answer = {"error": str(e)}
+    latency_ms = (time.perf_counter() - started) * 1000
+
+    if answer.get("error"):
+        logging.error(f"Gemini error: {answer['error']}")
+        record_stage(stage, estimated_tokens, 0, 0, latency_ms)
+        prompt_templates.record_call(prompt, estimated_tokens, latency_ms, error=True)
+        return {"text": f"Error: {answer['error']}"}
+
+    text = answer["text"]
+    usage = answer.get("usage") or {}
+    input_tokens = usage.get("promptTokenCount", estimated_tokens)
+    record_stage(
+        stage,
+        estimated_tokens,
+        input_tokens,
+        usage.get("candidatesTokenCount", estimate_tokens(text)),
+        latency_ms,
+    )
+    # Per template version when the prompt came from the registry.
+    prompt_templates.record_call(prompt, input_tokens, latency_ms)
     logging.debug(f"Gemini response: {text[:200]}...")
     return {"text": text}
 
+def generate_json(prompt: str, stage: str, default: str = "{}"):
+    """Model call whose answer should be JSON; parse success is recorded per prompt template."""
+    text = gemini_generate_text(prompt, stage=stage).get("text", default)
+    parsed = extract_json(text)
+    if not text.startswith("Error: "):
+        prompt_templates.record_parse(prompt, bool(parsed))
+    return parsed
+
+def vertex_embed_text(text: str) -> list:
+    """Embed text with a Vertex AI text-embedding model."""
+    access_token = get_adc_access_token()
+    url = f"{VERTEX_API_BASE}/v1/projects/{PROJECT_ID}/locations/{REGION}/publishers/google/models/{EMBEDDING_MODEL}:predict"
+    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+    resp = http_session().post(url, headers=headers, json={"instances": [{"content": text}]}, timeout=30)
+    resp.raise_for_status()
+    return resp.json()["predictions"][0]["embeddings"]["values"]
+
 def bq_insert_filtered(dataset, table, rows):
     client = bq_client()
     table_id = f"{PROJECT_ID}.{dataset}.{table}"
@@ -122,12 +278,225 @@ def bq_insert_filtered(dataset, table, rows):
         logging.error(f"BigQuery insert error: {e}")
         return [{"error": str(e)}]
 
+# ------------ Requirement index ------------
+requirement_index = SimilarityIndex(embed=vertex_embed_text if SIMILARITY_EMBEDDINGS else None)
+
+def few_shot_example(match, field: str) -> str:
+    """Prompt snippet showing what the pipeline produced for a similar requirement."""
+    if not match or not match[1].get(field):
+        return ""
+    record = match[1]
+    return (
+        "Example output for a similar requirement processed earlier:\n"
+        f"Requirement: {fit_text(record['prompt'], 256)}\n"
+        f"Output: {fit_json(record[field], 512)}\n\n"
+    )
+
+# ------------ Local store ------------
+store = LocalStore()
+bq_replica = BigQueryReplicator(bq_insert_filtered)
+
+def persist_normalize_result(prompt: str, requirement, test_cases, iso_validation):
+    """Write a pipeline result to the local store and queue the BigQuery copy.
+
+    Returns the requirement as stored (its req_id may have been made unique).
+    """
+    if not isinstance(requirement, dict) or not requirement.get("req_id"):
+        return requirement
+    req_id = requirement["req_id"]
+    stored_prompt = store.requirement_prompt(req_id)
+    if stored_prompt is not None and prompt_key(stored_prompt) != prompt_key(prompt) and req_id not in prompt:
+        # The model handed out an id (REQ-001) it already gave a different
+        # requirement. Ids written in the prompt are the author's, so a new
+        # text under one is a revision and replaces the old row instead.
+        req_id = f"{req_id}-{prompt_key(prompt)[:8]}"
+        requirement = {**requirement, "req_id": req_id}
+    verdicts = [{**v, "req_id": req_id} for v in to_verdict_list(iso_validation, requirement)]
+    store.upsert_requirements([{**requirement, "prompt": prompt}])
+    store.replace_results(req_id, as_case_list(test_cases), verdicts)
+
+    bq_replica.enqueue("qa_metrics", "trace", [{
+        "req_id": req_id,
+        "design_ref": requirement.get("invariant"),
+        "code_symbol": requirement.get("hazard"),
+        "test_name": requirement.get("description"),
+        "artifact_hash": "; ".join(map(str, requirement.get("acceptance_criteria") or [])),
+        "version": "v1",
+    }])
+    bq_replica.enqueue("qa_metrics", "iso_validation", [
+        {**v, "validated_at": v.get("validated_at") or datetime.utcnow().isoformat()} for v in verdicts
+    ])
+    return requirement
+
+# ------------ Artifacts ------------
+artifacts = ArtifactStore(gcs_client, DEFAULT_BUCKET)
+
+# ------------ Pipeline ------------
+def is_complete_result(requirement, test_cases, iso_validation) -> bool:
+    """All three stages parsed and no ISO verdict is an error placeholder."""
+    if not requirement or not as_case_list(test_cases) or not iso_validation:
+        return False
+    verdicts = iso_validation if isinstance(iso_validation, list) else [iso_validation]
+    return not any(isinstance(v, dict) and v.get("error") for v in verdicts)
+
+def run_normalize_pipeline(prompt: str, iso_mode: str = ISO_VALIDATION_MODE) -> dict:
+    """Normalize a requirement, generate test cases and ISO-validate them."""
+    logging.info(f"Normalizing requirement: {prompt}")
+    result = {"requirement": None, "test_cases": None, "iso_validation": None}
+
+    # Reuse a prior run of exactly this requirement; similar ones are only few-shot examples.
+    # Both depend on what the index holds at the time, so they are off while a
+    # cassette records or replays: its keys must depend on the requirement alone.
+    use_index = not model_cassette.enabled
+    record = requirement_index.exact(prompt) if SIMILARITY_REUSE and use_index else None
+    if record and is_complete_result(record.get("requirement"), record.get("test_cases"), record.get("iso_validation")):
+        logging.info("Reusing indexed result of an identical requirement")
+        result.update({
+            "requirement": record["requirement"],
+            "test_cases": record["test_cases"],
+            "iso_validation": record["iso_validation"],
+            "reused_from": {"prompt": record["prompt"]},
+        })
+        return result
+    match = requirement_index.best_match(prompt, SIMILARITY_FEWSHOT_THRESHOLD) if use_index else None
+
+    # Normalize requirement
+    norm_prompt = prompt_templates.render(
+        "normalize",
+        key=prompt,
+        example=few_shot_example(match, "requirement"),
+        requirement=fit_text(prompt, budget_for("normalize") - 64),
+    )
+    requirement = generate_json(norm_prompt, "normalize")
+    logging.debug(f"Requirement parsed: {requirement}")
+    result["requirement"] = requirement
+
+    # Generate test cases
+    tc_prompt = prompt_templates.render(
+        "test_cases",
+        key=prompt,
+        example=few_shot_example(match, "test_cases"),
+        requirement=fit_text(prompt, budget_for("test_cases") - 64),
+    )
+    test_cases = generate_json(tc_prompt, "test_cases", default="[]")
+    logging.debug(f"Test cases parsed: {test_cases}")
+    result["test_cases"] = test_cases
+
+    # ISO Validation
+    if iso_mode == "per_case":
+        iso_validation = validate_per_case(
+            requirement,
+            test_cases,
+            lambda p: generate_json(p, "iso_case"),
+        )
+    else:
+        iso_validation = generate_json(build_batch_prompt(requirement, test_cases), "iso_validation")
+    logging.debug(f"ISO validation parsed: {iso_validation}")
+    result["iso_validation"] = iso_validation
+
+    # Persisted first: it may rename a colliding req_id, and the index must keep the stored one.
+    requirement = persist_normalize_result(prompt, requirement, test_cases, iso_validation)
+    result["requirement"] = requirement
+    # Only complete results go into the index; a failed stage must never be reused.
+    if is_complete_result(requirement, test_cases, iso_validation):
+        requirement_index.add(prompt, requirement, test_cases, iso_validation)
+
+    return result
+
 # ------------ Routes ------------
+# Recent per-request profiles, readable from any worker with CACHE_BACKEND=shared.
+_profiles = make_cache("profiles", 100)
+
+def is_admin() -> bool:
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+@app.before_request
+def _start_request_timer():
+    start_request()
+    # X-Profile: 1 (with the admin token) samples just this request's thread.
+    if request.headers.get("X-Profile") and is_admin():
+        try:
+            sampler = Sampler(request.args.get("profile_interval_ms", PROFILE_INTERVAL_MS, type=float),
+                              thread_id=threading.get_ident())
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        g.profiler = sampler.start()
+
+@app.after_request
+def _finish_request_profile(response):
+    sampler = g.pop("profiler", None)
+    if sampler is not None:
+        sampler.stop()
+        profile_id = uuid.uuid4().hex[:12]
+        _profiles.set(profile_id, {
+            "path": request.path,
+            **sampler.summary(),
+            "collapsed": sampler.collapsed(),
+        }, ttl=3600)
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+@app.teardown_request
+def _finish_request_timer(exc):
+    finish_request()
+
+@app.route("/admin/profile", methods=["GET"])
+def admin_profile():
+    """Sample this worker for ?seconds=N and return collapsed stacks (flamegraph.pl / speedscope input)."""
+    if not is_admin():
+        return jsonify({"error": "forbidden"}), 403
+    try:
+        sampler = profile_for(request.args.get("seconds", 10, type=float),
+                              request.args.get("interval_ms", PROFILE_INTERVAL_MS, type=float))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    resp = app.response_class(sampler.collapsed(), mimetype="text/plain")
+    for key, value in sampler.summary().items():
+        resp.headers[f"X-Profile-{key.replace('_', '-').title()}"] = str(value)
+    resp.headers["X-Profile-Pid"] = str(os.getpid())
+    return resp
+
+@app.route("/admin/profile/<profile_id>", methods=["GET"])
+def admin_request_profile(profile_id):
+    """A per-request profile recorded with X-Profile; ?format=json for the summary too."""
+    if not is_admin():
+        return jsonify({"error": "forbidden"}), 403
+    profile = _profiles.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "unknown profile"}), 404
+    if request.args.get("format") == "json":
+        return jsonify(profile)
+    return app.response_class(profile["collapsed"], mimetype="text/plain")
 
 @app.route("/healthz", methods=["GET"])
 def healthz():
     return jsonify({"status": "ok"}), 200
 
+@app.route("/metrics/stages", methods=["GET"])
+def metrics_stages():
+    """Per-stage prompt size, output size and model latency since startup."""
+    return jsonify(stage_stats()), 200
+
+@app.route("/metrics/prompts", methods=["GET"])
+def metrics_prompts():
+    """Per prompt template version: input tokens, latency and JSON parse rate since startup."""
+    return jsonify(prompt_templates.stats()), 200
+
+@app.route("/metrics/process", methods=["GET"])
+def metrics_process():
+    """CPU vs I/O time per request in this worker, and the pool size it implies."""
+    profile = request_profile()
+    return jsonify({
+        **profile,
+        "cache_backend": os.getenv("CACHE_BACKEND", "local"),
+        "recommended": recommended_pool(profile["avg_cpu_ms"], profile["avg_io_ms"]),
+    }), 200
+
+@app.route("/metrics/cassette", methods=["GET"])
+def metrics_cassette():
+    return jsonify(model_cassette.stats()), 200
+
 @app.route("/chat", methods=["POST", "OPTIONS"])
 def chat():
     if request.method == "OPTIONS":
@@ -141,29 +510,33 @@ def chat():
 
     logging.info(f"/chat received prompt: {prompt}")
 
-    classify_prompt = (
-        "Classify the following input as either 'requirement' or 'general'. "
-        "Respond with JSON only: {\"intent\": \"requirement\"} or {\"intent\": \"general\"}.\n\n"
-        f"Input: {prompt}"
+    classify_prompt = prompt_templates.render(
+        "classify", key=prompt, input=fit_text(prompt, budget_for("classify") - 64)
     )
-    classify_text = gemini_generate_text(classify_prompt).get("text", "{}")
-    logging.debug(f"Classification raw: {classify_text}")
-
-    intent_obj = extract_json(classify_text)
+    intent_obj = generate_json(classify_prompt, "classify")
+    logging.debug(f"Classification parsed: {intent_obj}")
     intent = intent_obj.get("intent", "general")
     logging.info(f"Intent resolved: {intent}")
 
     if intent == "requirement":
         logging.info("Passing to normalize_requirement()")
-        with app.test_request_context("/tools/normalize_requirement", method="POST", json={"prompt": prompt}):
+        # Carry the client's content negotiation into the inner request.
+        headers = {k: request.headers[k] for k in ("Accept", "Accept-Encoding") if k in request.headers}
+        with app.test_request_context(
+            "/tools/normalize_requirement",
+            method="POST",
+            json={"prompt": prompt},
+            query_string=request.args,
+            headers=headers,
+        ):
             resp = normalize_requirement()
             logging.info("normalize_requirement() finished")
             return resp
     else:
         logging.info("Sending to Gemini general answer flow")
-        answer = gemini_generate_text(prompt)
+        answer = gemini_generate_text(fit_text(prompt, budget_for("general")))
         logging.info(f"General answer: {answer}")
-        return jsonify({"intent": "general", "answer": answer})
+        return respond({"intent": "general", "answer": answer}, request)
 
 @app.route("/tools/normalize_requirement", methods=["POST"])
 def normalize_requirement():
@@ -172,46 +545,8 @@ def normalize_requirement():
     if not prompt:
         return jsonify({"error": "prompt required"}), 400
 
-    logging.info(f"Normalizing requirement: {prompt}")
-    result = {"requirement": None, "test_cases": None, "iso_validation": None}
-
-    # Normalize requirement
-    norm_prompt = (
-        "Normalize the medical-device requirement into JSON with fields: "
-        "req_id, description, hazard, invariant, acceptance_criteria[].\n\n"
-        f"Requirement: {prompt}"
-    )
-    norm_text = gemini_generate_text(norm_prompt).get("text", "{}")
-    requirement = extract_json(norm_text)
-    logging.debug(f"Requirement parsed: {requirement}")
-    result["requirement"] = requirement
-
-    # Generate test cases
-    tc_prompt = (
-        f"Generate 3 detailed test cases in JSON for the requirement:\n{prompt}\n\n"
-        "Each test case must include: test_case_id, title, steps[], preconditions[], expected_result."
-    )
-    tc_text = gemini_generate_text(tc_prompt).get("text", "[]")
-    test_cases = extract_json(tc_text)
-    logging.debug(f"Test cases parsed: {test_cases}")
-    result["test_cases"] = test_cases
-
-    # ISO Validation
-    iso_prompt = (
-        "You are an auditor for ISO 62304 (medical device software lifecycle) "
-        "and ISO 14971 (risk management). "
-        "Review the following requirement and test cases and return JSON with fields: "
-        "req_id, test_case_id, compliant (true/false), missing_elements (string), "
-        "related_iso_refs (string), suggestions (string).\n\n"
-        f"Requirement: {json.dumps(requirement, indent=2)}\n\n"
-        f"Test Cases: {json.dumps(test_cases, indent=2)}"
-    )
-    iso_text = gemini_generate_text(iso_prompt).get("text", "{}")
-    iso_validation = extract_json(iso_text)
-    logging.debug(f"ISO validation parsed: {iso_validation}")
-    result["iso_validation"] = iso_validation
-
-    return jsonify(result)
+    result = run_normalize_pipeline(prompt, data.get("iso_mode", ISO_VALIDATION_MODE))
+    return respond(result, request)
 
 @app.route("/upload-docs", methods=["POST"])
 def upload_docs():
@@ -220,14 +555,178 @@ def upload_docs():
 
     uploaded_files = request.files.getlist("files")
     uploaded_paths = []
-    for file in uploaded_files:
-        filename = secure_filename(file.filename)
-        local_path = f"/tmp/{filename}"
-        file.save(local_path)
-        gcs_uri = upload_file_to_gcs(local_path, DEFAULT_BUCKET, f"uploads/{filename}")
-        uploaded_paths.append(gcs_uri)
-
-    return jsonify({"status": "success", "uploaded": uploaded_paths})
+    local_paths = []
+    # One private directory per request, so same-named files never overwrite each other.
+    workdir = tempfile.mkdtemp(prefix="upload_")
+    ingest = (request.form.get("ingest") or request.args.get("ingest", "")).lower() == "true"
+    try:
+        for file in uploaded_files:
+            filename = secure_filename(file.filename)
+            local_path = _workdir_path(workdir, len(local_paths), filename)
+            file.save(local_path)
+            gcs_uri = upload_file_to_gcs(local_path, DEFAULT_BUCKET, f"uploads/{filename}")
+            uploaded_paths.append(gcs_uri)
+            local_paths.append(local_path)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+
+    response = {"status": "success", "uploaded": uploaded_paths}
+    # ingest=true extracts the requirements from the documents and runs each
+    # through the normalize pipeline in the background; poll /ingest/<job_id>.
+    # The job then owns the directory and removes it when done.
+    if ingest:
+        response["ingest_job"] = start_ingest(local_paths, run_normalize_pipeline, workdir=workdir).job_id
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return jsonify(response)
+
+def _workdir_path(workdir: str, index: int, filename: str) -> str:
+    """A path for the index-th document that keeps its file name but can't collide."""
+    folder = os.path.join(workdir, str(index))
+    os.makedirs(folder)
+    return os.path.join(folder, filename)
+
+@app.route("/ingest", methods=["POST"])
+def ingest_docs():
+    """Ingest documents already uploaded to the bucket, e.g. {"paths": ["uploads/spec.md"]}."""
+    paths = (request.get_json(force=True) or {}).get("paths") or []
+    if not paths:
+        return jsonify({"error": "paths required"}), 400
+
+    bucket = gcs_client().bucket(DEFAULT_BUCKET)
+    local_paths = []
+    workdir = tempfile.mkdtemp(prefix="ingest_")
+    try:
+        for path in paths:
+            local_path = _workdir_path(workdir, len(local_paths), secure_filename(os.path.basename(path)))
+            bucket.blob(path).download_to_filename(local_path)
+            local_paths.append(local_path)
+    except Exception:
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    job = start_ingest(local_paths, run_normalize_pipeline, workdir=workdir)
+    return jsonify({"status": "accepted", "ingest_job": job.job_id}), 202
+
+@app.route("/ingest/<job_id>", methods=["GET"])
+def ingest_status(job_id):
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(status)
+
+@app.route("/store/requirements", methods=["GET"])
+def store_requirements():
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(store.find_requirements(hazard=request.args.get("hazard"), limit=limit))
+
+@app.route("/store/requirements/<req_id>", methods=["GET"])
+def store_requirement(req_id):
+    requirement = store.get_requirement(req_id)
+    if requirement is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(requirement)
+
+@app.route("/store/runs", methods=["GET", "POST"])
+def store_runs():
+    if request.method == "POST":
+        rows = (request.get_json(force=True) or {}).get("rows") or []
+        if any(not r.get("run_id") or not r.get("test_name") for r in rows):
+            return jsonify({"error": "run_id and test_name required on every row"}), 400
+        written = store.upsert_runs(rows)
+        bq_replica.enqueue("qa_metrics", "test_results", rows)
+        return jsonify({"status": "success", "written": written})
+
+    return jsonify(store.find_runs(
+        req_id=request.args.get("req_id"),
+        hazard=request.args.get("hazard"),
+        status=request.args.get("status"),
+        limit=request.args.get("limit", 100, type=int),
+    ))
+
+@app.route("/store/test_files", methods=["POST"])
+def store_test_files():
+    rows = (request.get_json(force=True) or {}).get("rows") or []
+    if any(not r.get("test_name") for r in rows):
+        return jsonify({"error": "test_name required on every row"}), 400
+    return jsonify({"status": "success", "written": store.upsert_test_files(rows)})
+
+@app.route("/tools/junit.ingest", methods=["POST"])
+def junit_ingest():
+    """Per-test-case results from a pytest JUnit report into the store and BigQuery.
+
+    Body: {"run_id", "gs_uri" | "xml", "req_id"?, "source"?}. The report is
+    streamed from GCS and never held in memory whole; "source" (the test
+    code) lets requirement ids be read from the test docstrings.
+    """
+    data = request.get_json(force=True) or {}
+    if not data.get("run_id") or not (data.get("gs_uri") or data.get("xml")):
+        return jsonify({"error": "run_id and gs_uri or xml required"}), 400
+
+    req_ids = req_ids_from_source(data["source"]) if data.get("source") else {}
+    fields = store.requirement_fields([data["req_id"]]).get(data["req_id"], {}) if data.get("req_id") else {}
+    fields = {"hazard": fields.get("hazard"), "invariant": fields.get("invariant")}
+
+    def replicate(rows):
+        bq_replica.enqueue("qa_metrics", "test_results", rows)
+
+    try:
+        if data.get("gs_uri"):
+            bucket, _, path = data["gs_uri"][len("gs://"):].partition("/")
+            with gcs_client().bucket(bucket).blob(path).open("rb") as source:
+                summary = ingest_junit(source, store, data["run_id"], req_ids, data.get("req_id"), replicate, fields)
+        else:
+            summary = ingest_junit(io.BytesIO(data["xml"].encode("utf-8")), store, data["run_id"], req_ids,
+                                   data.get("req_id"), replicate, fields)
+    except ET.ParseError as e:
+        return jsonify({"error": f"invalid JUnit XML: {e}"}), 400
+    return jsonify({"status": "success", **summary})
+
+@app.route("/tools/check_test_code", methods=["POST"])
+def check_generated_test_code():
+    """Static validation of generated pytest code before it is uploaded or run."""
+    data = request.get_json(force=True) or {}
+    if not data.get("code"):
+        return jsonify({"error": "code required"}), 400
+    result = check_test_code(data["code"])
+    return jsonify(result), 200 if result["ok"] else 422
+
+@app.route("/tools/artifacts.write", methods=["POST"])
+def artifacts_write():
+    """Store generated tests / pytest reports content-addressed, plus a run manifest.
+
+    Body: {"run_id"?, "req_id"?, "files": [{"name", "content" | "content_b64",
+    "publish_path"?}]}. Unchanged content is not uploaded again. Without a
+    req_id, each test file's is taken from its name (PUMP_BASAL_RATE_001_test.py).
+    """
+    data = request.get_json(force=True) or {}
+    files = data.get("files") or []
+    if not files or any(not f.get("name") for f in files):
+        return jsonify({"error": "files with name required"}), 400
+
+    run_id = data.get("run_id") or datetime.utcnow().strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:8]
+    entries = []
+    for f in files:
+        if "content_b64" in f:
+            content = base64.b64decode(f["content_b64"])
+        else:
+            content = (f.get("content") or "").encode("utf-8")
+        entry = artifacts.put_bytes(f["name"], content)
+        if f.get("publish_path"):
+            entry["published_uri"] = artifacts.publish(entry, f["publish_path"])
+        entries.append(entry)
+
+    store.upsert_test_files([
+        {
+            "test_name": e["name"],
+            "req_id": data.get("req_id") or req_id_from_name(e["name"]),
+            "gs_uri": e.get("published_uri", e["gs_uri"]),
+            "sha256": e["sha256"],
+        }
+        for e in entries if e["name"].endswith(".py")
+    ])
+    manifest_uri = artifacts.write_manifest(run_id, entries)
+    return jsonify({"run_id": run_id, "manifest": manifest_uri, "artifacts": entries})
 
 @app.route("/sample-data", methods=["GET"])
 def sample_data():
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+# ------------ Config ------------
+# local  - per-process in-memory LRU (each gunicorn worker has its own copy)
+# shared - one SQLite file on tmpfs that every worker on the host reads and writes
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "local").lower()
+SHARED_CACHE_PATH = os.getenv(
+    "SHARED_CACHE_PATH",
+    "/dev/shm/healthcare_cache.db" if os.path.isdir("/dev/shm") else "/tmp/healthcare_cache.db",
+)
+
+
+class LocalCache:
+    """Thread-safe in-process LRU with optional per-entry TTL."""
+
+    def __init__(self, namespace: str, max_entries: int = 1024):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float = None):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _create_private(path: str):
+    """Create `path` as an owner-only file (SQLite gives its -wal/-shm files the same mode)."""
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    except OSError as e:  # surfaced like any other cache failure: logged, treated as a miss
+        raise sqlite3.OperationalError(f"Cannot open shared cache {path}: {e}")
+    try:
+        st = os.fstat(fd)
+        if hasattr(os, "getuid") and st.st_uid != os.getuid():
+            raise sqlite3.OperationalError(f"Shared cache {path} is owned by another user")
+        if st.st_mode & 0o077:
+            os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+class SharedCache:
+    """Cache shared by every worker process on the host.
+
+    Backed by a SQLite database on tmpfs (/dev/shm), so a value computed by
+    one gunicorn worker is a hit for all of them and memory does not grow
+    with the worker count. Values must be JSON-serializable. Connections are
+    opened lazily per process and thread, which keeps it safe to create the
+    cache before gunicorn forks (--preload). The file lives in a world-writable
+    directory, so it is created 0600 and refused if another user owns it.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 1024, path: str = SHARED_CACHE_PATH):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            _create_private(self.path)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # tmpfs: nothing to make durable
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL, touched_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_touched ON cache(namespace, touched_at)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str):
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Shared cache read failed ({self.namespace}): {e}")
+            return None
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = None):
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, touched_at) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value, separators=(",", ":")), now + ttl if ttl else None, now),
+            )
+            self._writes += 1
+            if self._writes % 64 == 0:
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"Shared cache write failed ({self.namespace}): {e}")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop expired entries, then the oldest ones beyond max_entries."""
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at < ?",
+            (self.namespace, time.time()),
+        )
+        conn.execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ? ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.max_entries),
+        )
+
+
+def make_cache(namespace: str, max_entries: int = 1024):
+    """Cache for `namespace` using the configured CACHE_BACKEND."""
+    if CACHE_BACKEND == "shared":
+        return SharedCache(namespace, max_entries)
+    return LocalCache(namespace, max_entries)
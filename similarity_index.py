@@ -0,0 +1,191 @@
+import os
+import json
+import zlib
+import hashlib
+import logging
+import threading
+
+import numpy as np
+
+# ------------ Config ------------
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "/tmp/requirement_index.jsonl")
+SIMILARITY_DIM = int(os.getenv("SIMILARITY_DIM", "2048"))
+# Serve a stored result for a requirement seen before (exact normalized text).
+SIMILARITY_REUSE = os.getenv("SIMILARITY_REUSE", "true").lower() == "true"
+SIMILARITY_FEWSHOT_THRESHOLD = float(os.getenv("SIMILARITY_FEWSHOT_THRESHOLD", "0.75"))
+
+NGRAM_SIZES = (3, 4, 5)
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split())
+
+def prompt_key(text: str) -> str:
+    """Exact-match key of a requirement: case and whitespace differences don't count."""
+    return hashlib.sha1(_normalize_text(text).encode("utf-8")).hexdigest()
+
+def hashed_ngrams(text: str, dim: int = SIMILARITY_DIM) -> np.ndarray:
+    """Term counts of character n-grams hashed into a fixed-width vector.
+
+    Hashing keeps the vector width constant as the corpus grows, so the index
+    never has to refit a vocabulary and a record's vector can always be
+    recomputed from its text (which is what lets the on-disk format be a
+    plain append-only JSONL file).
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    text = f" {_normalize_text(text)} "
+    for n in NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            vec[zlib.crc32(text[i:i + n].encode("utf-8")) % dim] += 1.0
+    return vec
+
+
+class SimilarityIndex:
+    """TF-IDF index over past requirements and their pipeline outputs.
+
+    Each record holds the raw requirement prompt plus what the pipeline made
+    of it (normalized requirement, test cases, ISO validation). Lookups return
+    the closest records by cosine similarity of TF-IDF weighted n-gram
+    vectors, or of embeddings when an `embed` callable is configured.
+
+    Similarity is only a hint for few-shot examples: "below 70 mg/dL" and
+    "above 70 mg/dL" score 0.99 yet mean the opposite. A stored result is
+    served as-is only through `exact()`, for the same normalized text.
+    """
+
+    def __init__(self, path: str = SIMILARITY_INDEX_PATH, dim: int = SIMILARITY_DIM, embed=None):
+        self.path = path
+        self.dim = dim
+        self.embed = embed
+        self._lock = threading.Lock()
+        self._records = []
+        self._by_key = {}  # prompt_key -> latest record with that text
+        self._tf = np.zeros((0, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.float32)
+        # Per-record embeddings while every record has one; None once any is missing.
+        self._embeddings = [] if embed else None
+        self._weighted = None  # cached normalized TF-IDF matrix, rebuilt after adds
+        self._embedded = None  # cached normalized embedding matrix
+        self._offset = 0  # bytes of the JSONL file already ingested
+        with self._lock:
+            self._refresh()
+        logging.info(f"Loaded {len(self._records)} requirements into similarity index")
+
+    # ------------ Persistence ------------
+    def _refresh(self):
+        """Ingest records appended to the file since the last read.
+
+        Every gunicorn worker appends to the same file, so tailing it keeps
+        each worker's index in step with what the others have processed.
+        Caller holds the lock.
+        """
+        if not self.path or not os.path.exists(self.path) or os.path.getsize(self.path) <= self._offset:
+            return
+        rows, records = [], []
+        with open(self.path, "rb") as fh:
+            fh.seek(self._offset)
+            for raw in fh:
+                if not raw.endswith(b"\n"):
+                    break  # another worker is mid-write; pick it up next time
+                self._offset += len(raw)
+                try:
+                    record = json.loads(raw)
+                except ValueError:
+                    logging.warning(f"Skipping corrupt similarity index line in {self.path}")
+                    continue
+                records.append(record)
+                rows.append(hashed_ngrams(record["prompt"], self.dim))
+        if rows:
+            self._ingest(records, np.vstack(rows))
+
+    def _ingest(self, records: list, tf: np.ndarray):
+        embeddings = [r.pop("embedding", None) for r in records]
+        self._records.extend(records)
+        for record in records:
+            self._by_key[prompt_key(record["prompt"])] = record
+        self._tf = np.vstack([self._tf, tf])
+        self._df += (tf > 0).sum(axis=0)
+        if self._embeddings is not None:
+            ok = all(e is not None for e in embeddings)
+            self._embeddings = self._embeddings + [np.asarray(e, dtype=np.float32) for e in embeddings] if ok else None
+        self._weighted = None
+        self._embedded = None
+
+    def _append(self, record: dict, embedding):
+        line = dict(record)
+        if embedding is not None:
+            line["embedding"] = [round(float(x), 6) for x in embedding]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "ab") as fh:
+            fh.write(json.dumps(line, separators=(",", ":")).encode("utf-8") + b"\n")
+
+    # ------------ Index ------------
+    def __len__(self):
+        return len(self._records)
+
+    def _idf(self) -> np.ndarray:
+        n = len(self._records)
+        return np.log((1.0 + n) / (1.0 + self._df)) + 1.0
+
+    def add(self, prompt: str, requirement, test_cases, iso_validation=None):
+        record = {
+            "prompt": prompt,
+            "requirement": requirement,
+            "test_cases": test_cases,
+            "iso_validation": iso_validation,
+        }
+        embedding = self._embed(prompt)
+        with self._lock:
+            if self.path:
+                # Written first and read back, so this worker and the others ingest it the same way.
+                self._append(record, embedding)
+                self._refresh()
+            else:
+                record["embedding"] = embedding
+                self._ingest([record], hashed_ngrams(prompt, self.dim)[None, :])
+
+    def search(self, prompt: str, k: int = 3) -> list:
+        """Return up to k (score, record) pairs, best first."""
+        embedding = self._embed(prompt) if self._embeddings else None
+        with self._lock:
+            self._refresh()
+            if not self._records:
+                return []
+            if embedding is not None and self._embeddings:
+                if self._embedded is None:
+                    self._embedded = _unit_rows(np.vstack(self._embeddings))
+                scores = self._embedded @ _unit_rows(embedding[None, :])[0]
+            else:
+                idf = self._idf()
+                if self._weighted is None:
+                    self._weighted = _unit_rows(self._tf * idf)
+                scores = self._weighted @ _unit_rows((hashed_ngrams(prompt, self.dim) * idf)[None, :])[0]
+            top = np.argsort(-scores)[:k]
+            return [(float(scores[i]), self._records[i]) for i in top]
+
+    def exact(self, prompt: str):
+        """The latest record for exactly this requirement (normalized text), or None."""
+        with self._lock:
+            self._refresh()
+            return self._by_key.get(prompt_key(prompt))
+
+    def best_match(self, prompt: str, threshold: float):
+        matches = self.search(prompt, k=1)
+        if matches and matches[0][0] >= threshold:
+            return matches[0]
+        return None
+
+    def _embed(self, text: str):
+        if not self.embed:
+            return None
+        try:
+            vec = self.embed(text)
+        except Exception as e:
+            logging.warning(f"Embedding failed, falling back to n-gram similarity: {e}")
+            return None
+        return np.asarray(vec, dtype=np.float32) if vec else None
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
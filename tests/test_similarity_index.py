@@ -0,0 +1,52 @@
+"""Near-duplicate requirements with opposite meaning must never share results."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similarity_index import SIMILARITY_FEWSHOT_THRESHOLD, SimilarityIndex  # noqa: E402
+
+BASE = (
+    "CGM_LOW_ALARM_004: While closed-loop mode is active, the insulin pump controller shall {action} "
+    "the hypoglycemia alarm and suspend basal delivery when the predicted glucose value over the next "
+    "30 minutes is {direction} 70 mg/dL, based on at least three consecutive valid sensor readings "
+    "received within the last 15 minutes. The alarm shall be annunciated both audibly and visually on "
+    "the pump display and on any paired handheld device."
+)
+
+OPPOSITE_PAIRS = [
+    (BASE.format(action="raise", direction="below"), BASE.format(action="raise", direction="above")),
+    (BASE.format(action="raise", direction="below"), BASE.format(action="suppress", direction="below")),
+    (
+        "PUMP_BASAL_RATE_001: The insulin pump shall deliver a basal rate of 0.5 U/h.",
+        "PUMP_BASAL_RATE_001: The insulin pump shall deliver a basal rate of 5.0 U/h.",
+    ),
+    (
+        "PUMP_BOLUS_002: The pump shall not permit a bolus while an occlusion alarm is active.",
+        "PUMP_BOLUS_002: The pump shall permit a bolus while an occlusion alarm is active.",
+    ),
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SimilarityIndex(path=str(tmp_path / "index.jsonl"))
+
+
+@pytest.mark.parametrize("stored,asked", OPPOSITE_PAIRS)
+def test_similar_requirement_is_not_reused(index, stored, asked):
+    index.add(stored, {"req_id": "stored"}, [{"test_case_id": "TC-1"}], [{"compliant": True}])
+
+    match = index.best_match(asked, SIMILARITY_FEWSHOT_THRESHOLD)
+    assert match is not None  # still offered as a few-shot example
+    assert index.exact(asked) is None
+
+
+def test_identical_requirement_is_reused(index):
+    stored = BASE.format(action="raise", direction="below")
+    index.add(stored, {"req_id": "stored"}, [{"test_case_id": "TC-1"}], [{"compliant": True}])
+
+    record = index.exact("  " + stored.upper().replace(" ", "\n", 3))
+    assert record is not None and record["requirement"] == {"req_id": "stored"}